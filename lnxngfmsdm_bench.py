@@ -0,0 +1,175 @@
+#!/usr/bin/python3
+# Name:        LNX NG FMS Data Manager
+# Description: Navigraph FMS Data Manager alternative for Linux to manage AIRAC cycle databases
+# Version:     1.0.4
+# Requirement: Google Chrome Webbrowser to use the 'Download' feature via included Selenium WebDriver
+# Usage:       lnxngfmsdm_bench.py [--sizes 100,1000,10000] [--depth 3] [--sims XP11,XP12] [--churn 0.1] [--json]
+# -----------------------------------------------------------------------------
+# Copyright (c) 2024-2025 github.com/berndgz
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from xml.etree import ElementTree
+
+import lnxngfmsdm_core as core
+
+
+def get_files(count, depth):
+    # relative paths spread over a directory tree of the given depth, 10 directories per level
+    files = []
+    for i in range(count):
+        parts = [f"d{(i // 10 ** level) % 10}" for level in range(depth)]
+        files.append("/".join(parts + [f"file{i:06d}.dat"]))
+    return files
+
+
+def get_data(i, cycle, size, changed):
+    # text like navigation data, changed files contain the cycle
+    line = f"FIX{i:06d} {cycle if changed else '0000'} N47{i % 10000:04d} E008{i % 9999:04d}\n"
+    return (line * (size // len(line) + 1))[:size].encode()
+
+
+def write_index(files, cycle, revision, sims):
+    # Navigraph style index, one mapping per simulator, nested directory elements
+    root = ElementTree.Element("addon", cycle=cycle, revision=revision)
+    for sim in sims:
+        mapping = ElementTree.SubElement(root, "mapping", simulator=sim)
+        directories = {"": mapping}
+        for file in files:
+            parent = ""
+            for name in file.split("/")[:-1]:
+                path = parent + "/" + name
+                if path not in directories:
+                    directories[path] = ElementTree.SubElement(directories[parent], "directory", name=name)
+                parent = path
+            ElementTree.SubElement(directories[parent], "files", destination=file.split("/")[-1])
+    return ElementTree.tostring(root, encoding="utf-8", xml_declaration=True)
+
+
+def make_archive(file, files, cycle, revision, sims, size, changes, offset=0):
+    # zip with the index in the root and every 'changes' file depending on the cycle, offset is the number of
+    # the first file, a file keeps its content while it stays in the cycles
+    with zipfile.ZipFile(file, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("bench.index", write_index(files, cycle, revision, sims))
+        for i, name in enumerate(files, offset):
+            zf.writestr(name, get_data(i, cycle, size, changes and i % changes == 0))
+
+
+def measure(results, phase, files, size, function, *args):
+    # wall time and peak traced memory of one phase
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    function(*args)
+    seconds = time.perf_counter() - start
+    results.append({"files": files, "phase": phase, "seconds": seconds,
+                    "files_per_second": files / seconds if seconds else 0.0,
+                    "mb_per_second": files * size / 1024 ** 2 / seconds if seconds else 0.0,
+                    "peak_mb": tracemalloc.get_traced_memory()[1] / 1024 ** 2})
+
+
+def run(count, args, work):
+    results = []
+    directory = os.path.join(work, str(count))
+    fixtures = os.path.join(directory, "fixtures")
+    downloads = os.path.join(directory, "downloads")
+    path = os.path.join(directory, "install")
+    for name in (fixtures, downloads, path):
+        os.makedirs(name)
+    # every cycle drops the first 'churn' files of the previous one and adds as many new files
+    churn = int(count * args.churn)
+    cycles = ["2401", "2402", "2403"]
+    files = get_files(count + churn * (len(cycles) - 1), args.depth)
+    for number, cycle in enumerate(cycles):
+        make_archive(os.path.join(fixtures, f"bench_{cycle}.zip"), files[number * churn:number * churn + count], cycle, "1",
+                     args.sims, args.file_size, args.changes, number * churn)
+
+    core.setup(os.path.join(directory, "bench.db"))
+    core.Addon.download = downloads
+    core.store_path = os.path.join(directory, "store")
+    addon = core.Addon(1, "Benchmark", "bench_*.zip", path, args.sims[0], "Linux")
+    core.addons = [addon]
+
+    def stage(cycle):
+        shutil.copy(os.path.join(fixtures, f"bench_{cycle}.zip"), downloads)
+        core.get_archive(addon)
+
+    # first install into an empty directory
+    stage(cycles[0])
+    measure(results, "install_addon", count, args.file_size, core.install_addon, addon)
+    measure(results, "get_index", count, args.file_size, core.get_index, addon)
+    measure(results, "parse_index", count, args.file_size, core.parse_index, addon.idx, addon.sim)
+    measure(results, "get_cycle", count, args.file_size, core.get_cycle, addon)
+    measure(results, "get_cycle cached", count, args.file_size, core.get_cycle, addon)
+    measure(results, "backup_addon", count, args.file_size, core.backup_addon, addon)
+    # next cycle, phase by phase
+    stage(cycles[1])
+    measure(results, "del_index", churn, args.file_size, core.del_index, addon)
+    measure(results, "install_addon incremental", count, args.file_size, core.install_addon, addon)
+    measure(results, "backup_addon dedup", count, args.file_size, core.backup_addon, addon)
+    # the whole pipeline
+    stage(cycles[2])
+    measure(results, "plan", count, args.file_size, core.plan, addon)
+    measure(results, "update", count, args.file_size, core.update, addon, True)
+    measure(results, "rollback", count, args.file_size, core.rollback, addon)
+    return results
+
+
+def print_results(results):
+    print(f"{'files':>7}  {'phase':<26}  {'seconds':>9}  {'files/s':>10}  {'MB/s':>8}  {'peak MB':>8}")
+    for row in results:
+        print(f"{row['files']:>7}  {row['phase']:<26}  {row['seconds']:>9.4f}  {row['files_per_second']:>10.0f}  "
+              f"{row['mb_per_second']:>8.1f}  {row['peak_mb']:>8.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="lnxngfmsdm_bench", description="offline benchmark of the update pipeline")
+    parser.add_argument("--sizes", default="100,1000,10000", help="comma separated file counts")
+    parser.add_argument("--depth", type=int, default=3, help="directory depth of the files")
+    parser.add_argument("--sims", default="XP11,XP12", help="comma separated simulator mappings, the first one is installed")
+    parser.add_argument("--file-size", type=int, default=2048, help="bytes per file")
+    parser.add_argument("--changes", type=int, default=10, help="every n-th file changes between cycles, 0 for none")
+    parser.add_argument("--churn", type=float, default=0.1, help="share of the files dropped and added between cycles")
+    parser.add_argument("--durability", default=core.durability, choices=["none", "syncfs", "fsync"])
+    parser.add_argument("--workers", type=int, default=core.extract_workers, help="threads writing small files")
+    parser.add_argument("--json", action="store_true", help="print machine readable JSON")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary directory")
+    args = parser.parse_args(argv)
+    args.sims = args.sims.split(",")
+    core.durability = args.durability
+    core.extract_workers = args.workers
+    work = tempfile.mkdtemp(prefix="lnxngfmsdm_bench_")
+    results = []
+    tracemalloc.start()
+    try:
+        for count in [int(size) for size in args.sizes.split(",")]:
+            results.extend(run(count, args, work))
+    finally:
+        tracemalloc.stop()
+        if args.keep:
+            print("kept '" + work + "'", file=sys.stderr)
+        else:
+            shutil.rmtree(work, ignore_errors=True)
+    if args.json:
+        json.dump({"python": sys.version.split()[0], "results": results}, sys.stdout, indent=2)
+        print()
+    else:
+        print_results(results)
+
+
+if __name__ == "__main__":
+    main()
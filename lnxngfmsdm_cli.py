@@ -0,0 +1,284 @@
+#!/usr/bin/python3
+# Name:        LNX NG FMS Data Manager
+# Description: Navigraph FMS Data Manager alternative for Linux to manage AIRAC cycle databases
+# Version:     1.0.4
+# Requirement: Google Chrome Webbrowser to use the 'Download' feature via included Selenium WebDriver
+# Usage:       lnxngfmsdm_cli.py [--db FILE] [--jobs N] [--json] {list,status,download,check,plan,update,rollback,verify,watch,archives,rebuild,add,remove,runs}
+# -----------------------------------------------------------------------------
+# Copyright (c) 2024-2025 github.com/berndgz
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+import lnxngfmsdm_core as core
+
+
+def get_items(ids):
+    # all addons or the addons with the given ids
+    if not ids:
+        return core.addons
+    items = [addon for addon in core.addons if addon.uid in ids]
+    missing = set(ids) - {addon.uid for addon in items}
+    if missing:
+        raise SystemExit("unknown addon id: " + ", ".join(str(uid) for uid in sorted(missing)))
+    return items
+
+
+def addon_to_dict(addon):
+    return {"id": addon.uid, "name": addon.name, "archive": addon.archive, "path": addon.path, "sim": addon.sim,
+            "opsys": addon.opsys, "cycle": addon.cycle, "revision": addon.revision}
+
+
+def cmd_list(args):
+    return [addon_to_dict(addon) for addon in core.addons]
+
+
+def cmd_status(args):
+    items = get_items(args.ids)
+    core.scan_archives(items)
+    airac = core.get_airac()
+    result = []
+    for addon in items:
+        archive = core.read_archive_index(addon.file) if addon.file != "/path/to/zip/file" else None
+        row = addon_to_dict(addon)
+        row.update({"airac": airac,
+                    "file": addon.file if addon.file != "/path/to/zip/file" else None,
+                    "file_cycle": archive.cycle if archive else None,
+                    "file_revision": archive.revision if archive else None,
+                    "current": addon.cycle == airac,
+                    "installed": core.is_installed(addon)})
+        result.append(row)
+    return result
+
+
+def cmd_download(args):
+    # the saved setting applies unless given, without a display Chrome has to run headless
+    if args.headless is not None:
+        core.headless = args.headless
+    elif not os.environ.get("DISPLAY") and not os.environ.get("WAYLAND_DISPLAY"):
+        core.headless = True
+    if args.update:
+        return core.download_update(workers=args.jobs, force=args.force)
+    return core.download(force=args.force)
+
+
+def cmd_check(args):
+    # "" for an intact archive, the error otherwise
+    items = get_items(args.ids)
+    core.scan_archives(items)
+    return {addon.uid: core.check_archive(addon.file, args.jobs) if addon.file != "/path/to/zip/file" else "no archive"
+            for addon in items}
+
+
+def cmd_plan(args):
+    return core.plan_update(get_items(args.ids), force=args.force)
+
+
+def cmd_update(args):
+    return core.update_all(get_items(args.ids), workers=args.jobs, force=args.force)
+
+
+def cmd_rollback(args):
+    return {addon.uid: core.rollback(addon) for addon in get_items(args.ids)}
+
+
+def cmd_verify(args):
+    return core.verify(get_items(args.ids), workers=args.jobs, quick=args.quick)
+
+
+def cmd_archives(args):
+    items = get_items(args.ids) if args.ids else [None]
+    rows = [row for addon in items for row in core.get_archives(addon)]
+    return [{"id": row[0], "addon_id": row[1], "name": row[2], "cycle": row[3], "revision": row[4], "size": row[5], "stored": row[6]}
+            for row in sorted(rows, key=lambda row: -row[6])]
+
+
+def cmd_rebuild(args):
+    # path of the rebuilt zip, None if it failed
+    return {"id": args.id, "file": core.rebuild_archive(args.id, args.directory)}
+
+
+def cmd_add(args):
+    uid = core.create_addon(args.name, args.archive, args.path, args.sim, args.opsys)
+    if uid is None:
+        raise SystemExit("addon '" + args.name + "' was not added")
+    core.get_addons()
+    return addon_to_dict(get_items([uid])[0])
+
+
+def cmd_runs(args):
+    return core.get_runs(args.limit)
+
+
+def cmd_watch(args):
+    # one result per updated archive, runs until interrupted
+    def updated(name, report):
+        if args.json:
+            print(json.dumps({"archive": name, "report": report}), flush=True)
+        else:
+            print_result("update", report)
+            sys.stdout.flush()
+
+    try:
+        core.watch(get_items(args.ids), callback=updated)
+    except KeyboardInterrupt:
+        pass
+    return None
+
+
+def cmd_remove(args):
+    addon = get_items([args.id])[0]
+    core.delete_addon(args.id)
+    return addon_to_dict(addon)
+
+
+def is_failed(command, result):
+    # exit status 1 when an addon failed to download, update or verify
+    if command in ("download", "update", "rollback", "check"):
+        return any(result.values())
+    if command == "plan":
+        return not core.check_plans(result)
+    if command == "verify":
+        return any(row["missing"] or row["modified"] for row in result.values())
+    if command == "rebuild":
+        return result["file"] is None
+    return False
+
+
+def print_result(command, result, files=False):
+    if command in ("list", "status", "add", "remove"):
+        # add and remove print the row of the addon
+        for row in [result] if command in ("add", "remove") else result:
+            line = f"{row['id']:>4}  {row['name']:<40}  {row['sim']:<5}  {row['opsys']:<7}  {row['cycle']} rev {row['revision']}"
+            if command == "status":
+                state = "installed" if row["installed"] else ("current" if row["current"] else "outdated")
+                archive = f"{row['file_cycle']} rev {row['file_revision']}" if row["file"] else "no archive"
+                line += f"  {state:<9}  {archive}"
+            elif command in ("add", "remove"):
+                line += "  added" if command == "add" else "  removed"
+            print(line)
+    elif command == "plan":
+        # no plan for tar archives
+        for row in filter(None, result):
+            print(f"{row['uid']:>4}  {row['name']:<40}  {row['from_cycle']} -> {row['cycle']} rev {row['revision']}  "
+                  f"delete {len(row['delete'])}, add {len(row['add'])}, overwrite {len(row['overwrite'])} files, "
+                  f"{row['net_bytes'] / 1024 ** 2:+.1f} MB, {row['free_bytes'] / 1024 ** 2:.1f} MB free"
+                  f"{', refused, ' + row['error'] if not row['valid'] else ', not enough space' if not row['fits'] else ''}")
+            if files:
+                for key in ("delete", "add", "overwrite"):
+                    for file in row[key]:
+                        print(f"      {key:<9}  {file}")
+    elif command == "check":
+        for uid, error in result.items():
+            print(f"{uid:>4}  {error or 'ok'}")
+    elif command in ("download", "update", "rollback"):
+        for uid, value in result.items():
+            print(f"{uid:>4}  {'ok' if value == 0 else 'failed'}")
+    elif command == "verify":
+        for uid, row in result.items():
+            print(f"{uid:>4}  {row['files']} files, {len(row['missing'])} missing, {len(row['modified'])} modified")
+    elif command == "archives":
+        for row in result:
+            stored = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row["stored"]))
+            print(f"{row['id']:>4}  addon {row['addon_id']:>4}  {row['name']:<40}  {row['cycle']} rev {row['revision']}  "
+                  f"{row['size'] / 1024 ** 2:9.1f} MB  {stored}")
+    elif command == "rebuild":
+        print(f"{result['id']:>4}  {result['file'] or 'failed'}")
+    elif command == "runs":
+        for row in result:
+            started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row["started"]))
+            print(f"{row['id']:>4}  {started}  {row['host']}  {row['command']:<8}  {row['status']:<6}  {row['finished'] - row['started']:9.3f} s")
+            for name, total in sorted(row["summary"].items(), key=lambda item: -item[1]["seconds"]):
+                print(f"      {name:<28}  {total['count']:>6} x  {total['seconds']:9.3f} s  max {total['max']:.3f} s")
+    else:
+        print(result)
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog="lnxngfmsdm", description="LNX NG FMS Data Manager")
+    parser.add_argument("--db", help="profile database, default ~/.lnxngfmsdm.db")
+    parser.add_argument("--jobs", type=int, help="number of parallel workers")
+    parser.add_argument("--json", action="store_true", help="print machine readable JSON, log output goes to stderr")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"], help="log level on stderr")
+    parser.add_argument("--durability", choices=["none", "syncfs", "fsync"], help="flush installed files: not at all, "
+                        "once per install or every file")
+    parser.add_argument("--trace", metavar="FILE", help="write a Chrome trace JSON file of the timed phases")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list addons")
+    status = commands.add_parser("status", help="installed and downloaded cycles of addons")
+    status.add_argument("ids", type=int, nargs="*")
+    download = commands.add_parser("download", help="download archives of outdated addons")
+    download.add_argument("--force", action="store_true", help="download current addons too")
+    download.add_argument("--update", action="store_true", help="install each archive as soon as its download is complete")
+    download.add_argument("--headless", action=argparse.BooleanOptionalAction, help="run Chrome without a window, "
+                          "default is the saved setting or headless without a display")
+    check = commands.add_parser("check", help="check the CRC-32 of every member of the downloaded archives")
+    check.add_argument("ids", type=int, nargs="*")
+    plan = commands.add_parser("plan", help="files an update would delete, add and overwrite, without changing anything")
+    plan.add_argument("--force", action="store_true", help="plan archives already installed too")
+    plan.add_argument("--files", action="store_true", help="list the files")
+    plan.add_argument("ids", type=int, nargs="*")
+    update = commands.add_parser("update", help="install downloaded archives")
+    update.add_argument("--force", action="store_true", help="reinstall archives already installed")
+    update.add_argument("ids", type=int, nargs="*")
+    rollback = commands.add_parser("rollback", help="restore the previous cycle from the snapshot of the last update")
+    rollback.add_argument("ids", type=int, nargs="+")
+    verify = commands.add_parser("verify", help="check installed files against the manifest")
+    verify.add_argument("--quick", action="store_true", help="compare size and mtime only")
+    verify.add_argument("ids", type=int, nargs="*")
+    add = commands.add_parser("add", help="add an addon")
+    add.add_argument("name")
+    add.add_argument("archive", help="archive file pattern, e.g. addon_*.zip")
+    add.add_argument("path", help="install directory")
+    add.add_argument("sim", choices=["XP10", "XP11", "XP12"])
+    add.add_argument("opsys", choices=["Windows", "MacOS", "Linux"])
+    watch = commands.add_parser("watch", help="update addons when their archive lands in the download directory")
+    watch.add_argument("ids", type=int, nargs="*")
+    archives = commands.add_parser("archives", help="archives in the archive store")
+    archives.add_argument("ids", type=int, nargs="*")
+    rebuild = commands.add_parser("rebuild", help="write a stored archive as zip file again")
+    rebuild.add_argument("id", type=int, help="archive id, see 'archives'")
+    rebuild.add_argument("directory", nargs="?", help="target directory, default is the download directory")
+    runs = commands.add_parser("runs", help="phase timings of the last runs")
+    runs.add_argument("--limit", type=int, default=10)
+    remove = commands.add_parser("remove", help="remove an addon")
+    remove.add_argument("id", type=int)
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    if args.jobs:
+        core.jobs = args.jobs
+    if args.durability:
+        core.durability = args.durability
+    logging.basicConfig(level=args.log_level, format="%(levelname)s %(message)s")
+    if args.trace:
+        core.enable_trace()
+    core.setup(args.db)
+    result = globals()["cmd_" + args.command](args)
+    if args.trace:
+        core.export_trace(args.trace)
+    # watch prints its results while running
+    if result is not None and args.json:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+    elif result is not None:
+        print_result(args.command, result, getattr(args, "files", False))
+    return 1 if is_failed(args.command, result) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -16,20 +16,217 @@
 # SOFTWARE.
 
 import base64
+import contextlib
+import ctypes
+import datetime
+import fcntl
+import fnmatch
+import functools
 import glob
+import hashlib
 import json
+import logging
 import os
+import select
 import shutil
+import struct
+import tarfile
+import threading
 import time
-import xml.dom.minidom
 import sqlite3
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.action_chains import ActionChains
+import zipfile
+import zlib
+from xml.etree import ElementTree
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 home_directory = os.path.expanduser('~')
+log = logging.getLogger("lnxngfmsdm")
 addons = []
-conn = None
+db_path = home_directory + "/.lnxngfmsdm.db"
+# one connection per thread, see get_connection()
+db_local = threading.local()
+# schema versions, a database is migrated from its 'PRAGMA user_version' to the last version
+migrations = [
+    [
+        """CREATE TABLE IF NOT EXISTS addons (
+               id INTEGER PRIMARY KEY, 
+               name text NOT NULL, 
+               archive text NOT NULL, 
+               path text NOT NULL, 
+               sim text NOT NULL, 
+               opsys text NOT NULL
+        );""",
+        """CREATE TABLE IF NOT EXISTS settings (
+               id INTEGER PRIMARY KEY, 
+               download text NOT NULL, 
+               username text NOT NULL, 
+               password text NOT NULL
+        );""",
+        """INSERT OR IGNORE INTO settings(id, download, username, password) 
+               VALUES (1, '/home/username/Downloads', 'username', 'cGFzc3dvcmQ=');"""
+    ],
+    [
+        """CREATE TABLE IF NOT EXISTS locators (
+               step text PRIMARY KEY, 
+               by text NOT NULL, 
+               value text NOT NULL, 
+               timeout real NOT NULL
+        );""",
+        """CREATE TABLE IF NOT EXISTS index_dirs (
+               path text PRIMARY KEY, 
+               mtime integer NOT NULL, 
+               files text NOT NULL
+        );""",
+        """CREATE TABLE IF NOT EXISTS indexes (
+               path text NOT NULL, 
+               sim text NOT NULL, 
+               mtime integer NOT NULL, 
+               size integer NOT NULL, 
+               cycle text NOT NULL, 
+               revision text NOT NULL, 
+               files text NOT NULL, 
+               PRIMARY KEY (path, sim)
+        );"""
+    ],
+    [
+        """CREATE TABLE IF NOT EXISTS manifest (
+               addon_id integer NOT NULL, 
+               cycle text NOT NULL, 
+               path text NOT NULL, 
+               size integer NOT NULL, 
+               mtime integer NOT NULL, 
+               crc integer NOT NULL, 
+               installed real NOT NULL, 
+               PRIMARY KEY (addon_id, cycle, path)
+        );"""
+    ],
+    [
+        """CREATE TABLE IF NOT EXISTS archives (
+               id INTEGER PRIMARY KEY, 
+               addon_id integer NOT NULL, 
+               name text NOT NULL, 
+               cycle text NOT NULL, 
+               revision text NOT NULL, 
+               size integer NOT NULL, 
+               stored real NOT NULL
+        );""",
+        """CREATE TABLE IF NOT EXISTS archive_members (
+               archive_id integer NOT NULL, 
+               position integer NOT NULL, 
+               name text NOT NULL, 
+               object text NOT NULL, 
+               size integer NOT NULL, 
+               date_time text NOT NULL, 
+               compress_type integer NOT NULL, 
+               external_attr integer NOT NULL, 
+               PRIMARY KEY (archive_id, position)
+        );""",
+        """CREATE INDEX IF NOT EXISTS archive_members_object ON archive_members(object);""",
+        """CREATE TABLE IF NOT EXISTS objects (
+               hash text PRIMARY KEY, 
+               size integer NOT NULL, 
+               stored integer NOT NULL
+        );"""
+    ],
+    [
+        """CREATE TABLE IF NOT EXISTS runs (
+               id INTEGER PRIMARY KEY, 
+               command text NOT NULL, 
+               host text NOT NULL, 
+               started real NOT NULL, 
+               finished real NOT NULL, 
+               status text NOT NULL, 
+               summary text NOT NULL
+        );"""
+    ],
+    [
+        """CREATE TABLE IF NOT EXISTS archive_checks (
+               path text PRIMARY KEY, 
+               size integer NOT NULL, 
+               mtime integer NOT NULL, 
+               error text NOT NULL, 
+               checked real NOT NULL
+        );"""
+    ],
+    [
+        """ALTER TABLE settings ADD COLUMN headless integer NOT NULL DEFAULT 0;"""
+    ],
+    [
+        # the 'locators' table keeps user overrides only, rows equal to the built-in locators were copied on connect
+        """ALTER TABLE settings ADD COLUMN download_timeout real NOT NULL DEFAULT 1800;""",
+        """UPDATE settings SET download_timeout = (SELECT timeout FROM locators WHERE step = 'downloaded') 
+               WHERE EXISTS (SELECT 1 FROM locators WHERE step = 'downloaded');""",
+        """DELETE FROM locators WHERE step = 'downloaded' OR (step, by, value, timeout) IN (VALUES 
+               ('consent', 'xpath', '//*[@id="consent"]/div/div/a[2]', 15), 
+               ('login', 'class name', 'login', 15), 
+               ('username', 'id', 'username', 15), 
+               ('password', 'id', 'password', 15), 
+               ('submit', 'id', 'login-id', 15), 
+               ('downloads', 'link text', 'Downloads', 30), 
+               ('addon', 'xpath', '//*[contains(text(),''{name}'')]/../td[4]/*[contains(text(),''{opsys}'')]', 30), 
+               ('account', 'xpath', '//a[@href="/account"]', 15), 
+               ('logout', 'link text', 'Sign out', 15), 
+               ('logged_out', 'class name', 'login', 15));"""
+    ]
+]
+# number of addons updated concurrently by update_all()
+jobs = min(4, os.cpu_count() or 1)
+path_locks = {}
+path_locks_lock = threading.Lock()
+# write only changed archive members and keep identical files on disk
+incremental = True
+# content-addressed store of processed archives, members identical across cycles and addons are stored once
+store_path = home_directory + "/.lnxngfmsdm.store"
+# archives kept per addon and total size of the stored objects
+store_keep = 3
+store_max_bytes = 4 * 1024 ** 3
+store_lock = threading.Lock()
+# AIRAC cycle 2001 became effective on 2020-01-02, every cycle lasts 28 days
+airac_epoch = datetime.date(2020, 1, 2)
+# run Chrome without a window for the 'Download' feature, overridden by the 'settings' table
+headless = False
+# seconds to wait for the archives of a download, overridden by the 'settings' table
+download_timeout = 1800
+# Navigraph website DOM locators per download step: (by, value, timeout), rows of the 'locators' table override single steps
+locators = {
+    "consent": ("xpath", '//*[@id="consent"]/div/div/a[2]', 15),
+    "login": ("class name", "login", 15),
+    "username": ("id", "username", 15),
+    "password": ("id", "password", 15),
+    "submit": ("id", "login-id", 15),
+    "downloads": ("link text", "Downloads", 30),
+    "addon": ("xpath", "//*[contains(text(),'{name}')]/../td[4]/*[contains(text(),'{opsys}')]", 30),
+    "account": ("xpath", '//a[@href="/account"]', 15),
+    "logout": ("link text", "Sign out", 15),
+    "logged_out": ("class name", "login", 15)
+}
+# extractor: bytes of the buffer reused per thread, members below extract_small bytes are written by
+# extract_workers threads, durability "none", "syncfs" (once per install) or "fsync" (every file)
+extract_buffer = 1024 * 1024
+extract_small = 256 * 1024
+extract_workers = min(8, (os.cpu_count() or 1) * 2)
+extract_local = threading.local()
+extract_lock = threading.Lock()
+durability = "none"
+# check_archive(): members are checked in tasks of about check_chunk compressed bytes
+check_chunk = 8 * 1024 ** 2
+# watch(): an archive is updated when it is unchanged for watch_settle seconds, polling interval without inotify
+watch_settle = 2.0
+watch_interval = 5.0
+# inotify(7) events of finished downloads, IN_CLOSE_WRITE | IN_MOVED_TO
+inotify_mask = 0x8 | 0x80
+# progress event subscribers, called as subscriber(event, data) from worker threads
+subscribers = []
+# span totals of the current run: name => [count, seconds, max seconds], see span() and run()
+span_totals = {}
+spans_lock = threading.Lock()
+run_command = None
+# runs kept in the 'runs' table
+runs_keep = 100
+# Chrome trace events, recorded after enable_trace() only
+trace_events = None
+trace_threads = {}
+trace_start = time.perf_counter()
 
 
 class Addon:
@@ -57,51 +254,286 @@ class Addon:
         return f"{cls.download}, {cls.username}, {cls.password}"
 
 
-def connect_sqlite_db():
-    global conn
-    sql_statements = [
-        """CREATE TABLE IF NOT EXISTS addons (
-               id INTEGER PRIMARY KEY, 
-               name text NOT NULL, 
-               archive text NOT NULL, 
-               path text NOT NULL, 
-               sim text NOT NULL, 
-               opsys text NOT NULL
-        );""",
-        """CREATE TABLE IF NOT EXISTS settings (
-               id INTEGER PRIMARY KEY, 
-               download text NOT NULL, 
-               username text NOT NULL, 
-               password text NOT NULL
-        );""",
-        """INSERT OR IGNORE INTO settings(id, download, username, password) 
-               VALUES (1, '/home/username/Downloads', 'username', 'cGFzc3dvcmQ=');"""
-    ]
+class Index:
+    # compact index record, files are the destination paths of one simulator mapping relative to the index directory
+    __slots__ = ("cycle", "revision", "files")
+
+    def __init__(self, cycle="0", revision="0", files=None):
+        self.cycle = cycle
+        self.revision = revision
+        self.files = [] if files is None else files
+
+
+class DownloadError(Exception):
+    pass
+
+
+class Progress:
+    # throttled progress events of one phase of one addon
+    interval = 0.1
+
+    def __init__(self, event, addon, total_bytes=0, total_files=0):
+        self.event = event
+        self.addon = addon
+        self.total_bytes = total_bytes
+        self.total_files = total_files
+        self.bytes = 0
+        self.files = 0
+        self.start = time.monotonic()
+        self.last = self.start
+
+    def advance(self, size=0, files=1):
+        self.bytes += size
+        self.files += files
+        now = time.monotonic()
+        if now - self.last >= self.interval:
+            self.last = now
+            self.emit()
+
+    def emit(self):
+        elapsed = time.monotonic() - self.start
+        emit(self.event, uid=self.addon.uid, name=self.addon.name, bytes=self.bytes, total_bytes=self.total_bytes,
+             files=self.files, total_files=self.total_files, elapsed=elapsed,
+             rate=self.bytes / elapsed / 1000000 if elapsed > 0 else 0.0)
+
+
+def subscribe(subscriber):
+    subscribers.append(subscriber)
+
+
+def unsubscribe(subscriber):
+    if subscriber in subscribers:
+        subscribers.remove(subscriber)
+
+
+def emit(event, **data):
+    for subscriber in list(subscribers):
+        try:
+            subscriber(event, data)
+        except Exception as err:
+            log.error(err)
+
+
+@contextlib.contextmanager
+def span(name, **args):
+    # timed section, summed up per name for the run summary and recorded for the trace export
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        with spans_lock:
+            total = span_totals.setdefault(name, [0, 0.0, 0.0])
+            total[0] += 1
+            total[1] += duration
+            total[2] = max(total[2], duration)
+            if trace_events is not None:
+                tid = threading.get_native_id()
+                trace_threads[tid] = threading.current_thread().name
+                trace_events.append({"name": name, "cat": "lnxngfmsdm", "ph": "X", "ts": (start - trace_start) * 1000000,
+                                     "dur": duration * 1000000, "pid": os.getpid(), "tid": tid, "args": args})
+        log.debug("%s took %.3f s %s", name, duration, args)
+
+
+def timed(function):
+    # span named after the function, the names of the addon arguments are added to the trace event
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        items = args[0] if args and isinstance(args[0], list) else args[:1]
+        with span(function.__name__, addon=", ".join(item.name for item in items if isinstance(item, Addon))):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+def has_failed(result):
+    # a return code or a report of return codes by addon
+    if isinstance(result, dict):
+        return any(result.values())
+    return bool(result)
+
+
+@contextlib.contextmanager
+def run(command, failed=has_failed):
+    # one download, update or verify, the span totals are stored in the 'runs' table, nested runs join the outer one
+    # the result of the command is set in the yielded list, failed() decides the status from it
+    global run_command, span_totals
+    with spans_lock:
+        nested = run_command is not None
+        if not nested:
+            run_command = command
+            span_totals = {}
+    outcome = [None]
+    if nested:
+        yield outcome
+        return
+    started = time.time()
+    status = "failed"
+    try:
+        with span(command):
+            yield outcome
+        status = "failed" if failed(outcome[0]) else "ok"
+    finally:
+        with spans_lock:
+            summary = {name: {"count": total[0], "seconds": total[1], "max": total[2]} for name, total in span_totals.items()}
+            run_command = None
+        store_run(command, started, time.time(), status, summary)
+
+
+def recorded(command, failed=has_failed):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with run(command, failed) as outcome:
+                outcome[0] = function(*args, **kwargs)
+                return outcome[0]
+        return wrapper
+    return decorator
+
+
+def store_run(command, started, finished, status, summary):
+    log.info("%s %s in %.3f s", command, status, finished - started)
+    for name, total in sorted(summary.items(), key=lambda item: -item[1]["seconds"]):
+        log.info("  %-28s %6d x %10.3f s, max %.3f s", name, total["count"], total["seconds"], total["max"])
+    try:
+        with transaction() as cur:
+            cur.execute("INSERT INTO runs(command, host, started, finished, status, summary) VALUES (?, ?, ?, ?, ?, ?)",
+                        (command, os.uname().nodename, started, finished, status, json.dumps(summary)))
+            cur.execute("DELETE FROM runs WHERE id NOT IN (SELECT id FROM runs ORDER BY id DESC LIMIT ?)", (runs_keep,))
+    except sqlite3.Error as e:
+        log.error(e)
+
+
+def get_runs(limit=20):
+    try:
+        cur = get_connection().execute("SELECT id, command, host, started, finished, status, summary FROM runs ORDER BY id DESC LIMIT ?", (limit,))
+        return [{"id": row[0], "command": row[1], "host": row[2], "started": row[3], "finished": row[4], "status": row[5],
+                 "summary": json.loads(row[6])} for row in cur.fetchall()]
+    except sqlite3.Error as e:
+        log.error(e)
+        return []
+
+
+def enable_trace():
+    global trace_events, trace_start
+    with spans_lock:
+        trace_events = []
+        trace_threads.clear()
+        trace_start = time.perf_counter()
+
+
+def export_trace(file):
+    # Chrome trace event format, opens in chrome://tracing and ui.perfetto.dev
+    with spans_lock:
+        events = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+                  for tid, name in trace_threads.items()] + list(trace_events or [])
+    with open(file, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+def get_connection():
+    # sqlite3 connections must not be shared between threads, WAL lets readers and one writer work concurrently
+    if getattr(db_local, "path", None) != db_path:
+        db_local.conn = sqlite3.connect(db_path, timeout=30)
+        db_local.conn.execute("PRAGMA journal_mode=WAL")
+        db_local.conn.execute("PRAGMA synchronous=NORMAL")
+        db_local.path = db_path
+        db_local.depth = 0
+    return db_local.conn
+
+
+@contextlib.contextmanager
+def transaction():
+    # statements inside are committed once, nested transactions join the outermost one
+    connection = get_connection()
+    db_local.depth += 1
+    try:
+        yield connection.cursor()
+    except BaseException:
+        db_local.depth -= 1
+        if db_local.depth == 0:
+            connection.rollback()
+        raise
+    db_local.depth -= 1
+    if db_local.depth == 0:
+        connection.commit()
+
+
+def migrate():
+    version = get_connection().execute("PRAGMA user_version").fetchone()[0]
+    for number in range(version + 1, len(migrations) + 1):
+        with transaction() as cur:
+            for statement in migrations[number - 1]:
+                cur.execute(statement)
+            cur.execute(f"PRAGMA user_version = {number}")
+        log.info("database migrated to version %s", number)
+
+
+def connect_sqlite_db(path=None):
+    global db_path
+    if path:
+        db_path = path
     try:
-        conn = sqlite3.connect(home_directory + "/.lnxngfmsdm.db")
-        print(sqlite3.sqlite_version)
-        cur = conn.cursor()
-        for statement in sql_statements:
-            cur.execute(statement)
-        conn.commit()
-        print(cur.lastrowid)
+        log.debug("sqlite %s", sqlite3.sqlite_version)
+        migrate()
     except sqlite3.Error as e:
-        print(e)
+        log.error(e)
+
+
+def get_airac(date=None, offset=0):
+    # AIRAC cycle ident YYNN effective on date, offset 1 is the next cycle
+    date = date or datetime.date.today()
+    effective = airac_epoch + datetime.timedelta(days=((date - airac_epoch).days // 28 + offset) * 28)
+    january = datetime.date(effective.year, 1, 1)
+    first = january + datetime.timedelta(days=(airac_epoch - january).days % 28)
+    return f"{effective.year % 100:02d}{(effective - first).days // 28 + 1:02d}"
+
+
+def is_current(addon):
+    # installed or downloaded data is on the current AIRAC cycle
+    cycle = get_airac()
+    if addon.cycle == cycle:
+        return True
+    if addon.file != "/path/to/zip/file":
+        index = read_archive_index(addon.file)
+        return index is not None and index.cycle == cycle
+    return False
+
+
+def is_installed(addon):
+    # the archive is installed already, without archive the installed data has to be on the current cycle
+    if addon.file == "/path/to/zip/file":
+        return addon.cycle == get_airac()
+    index = read_archive_index(addon.file)
+    return index is not None and index.cycle == addon.cycle and index.revision == addon.revision
 
 
 def get_settings():
+    global headless, download_timeout
     try:
-        cur = conn.cursor()
+        cur = get_connection().cursor()
         cur.execute("SELECT * FROM settings WHERE id =?", (1,))
         row = cur.fetchone()
         if row:
-            print("setting =>", row)
+            log.debug("setting => %s", row)
             Addon.download = row[1]
             Addon.username = row[2]
             Addon.password = row[3]
+            headless = bool(row[4])
+            download_timeout = row[5]
+    except sqlite3.Error as e:
+        log.error(e)
+    log.debug("Addon attr. => %s", Addon.attr_to_string())
+    get_locators()
+
+
+def get_locators():
+    try:
+        cur = get_connection().cursor()
+        cur.execute("SELECT step, by, value, timeout FROM locators")
+        for row in cur.fetchall():
+            locators[row[0]] = (row[1], row[2], row[3])
     except sqlite3.Error as e:
-        print(e)
-    print("Addon attr. => " + Addon.attr_to_string())
+        log.error(e)
 
 
 def set_settings():
@@ -114,18 +546,18 @@ def set_settings():
 def get_addons():
     global addons
     try:
-        cur = conn.cursor()
+        cur = get_connection().cursor()
         cur.execute("SELECT * FROM addons")
         rows = cur.fetchall()
         addons = []
         if len(rows) > 0:
             for row in rows:
-                print("addon =>", row)
+                log.debug("addon => %s", row)
                 addons.append(Addon(row[0], row[1], row[2], row[3], row[4], row[5]))
     except sqlite3.Error as e:
-        print(e)
+        log.error(e)
     for addon in addons:
-        print("Addon obj. => " + addon.to_string())
+        log.debug("Addon obj. => %s", addon.to_string())
 
 
 def set_addons():
@@ -133,62 +565,146 @@ def set_addons():
     addons.append(Addon(1, "FlightFactor A320Ultimate", "ffa320u_native_*.zip", "/home/bernd/X-Plane11/Aircraft/FlightFactor A320 ultimate", "XP11", "Linux"))
     addons.append(Addon(2, "X-Plane 11 (11.50+)", "xplane11_native_*.zip", "/home/bernd/X-Plane11/Custom Data", "XP11", "Linux"))
     addons.append(Addon(3, "X-Plane GNS430", "xplane_customdata_native_*.zip", "/home/bernd/X-Plane11/Custom Data/GNS430", "XP11", "Linux"))
-    for addon in addons:
-        upsert_addon(addon.uid, addon.name, addon.archive, addon.path, addon.sim, addon.opsys)
+    upsert_addons([(addon.uid, addon.name, addon.archive, addon.path, addon.sim, addon.opsys) for addon in addons])
 
 
-def upsert_setting(downloads, username, password):
+def upsert_setting(downloads, username, password, hidden=None, timeout=None):
+    # hidden and timeout None keep the current headless and download timeout settings
+    if hidden is None:
+        hidden = headless
+    if timeout is None:
+        timeout = download_timeout
     try:
-        sql = """INSERT OR REPLACE INTO settings(id, download, username, password) VALUES (?, ?, ?, ?)"""
-        cur = conn.cursor()
-        cur.execute(sql, (1, downloads, username, password))
-        conn.commit()
-        print(cur.lastrowid)
+        sql = """INSERT OR REPLACE INTO settings(id, download, username, password, headless, download_timeout) VALUES (?, ?, ?, ?, ?, ?)"""
+        with transaction() as cur:
+            cur.execute(sql, (1, downloads, username, password, int(hidden), timeout))
+            log.debug("row => %s", cur.lastrowid)
     except sqlite3.Error as e:
-        print(e)
+        log.error(e)
 
 
 def upsert_addon(uid, name, archive, path, sim, opsys):
     try:
         sql = """INSERT OR REPLACE INTO addons(id, name, archive, path, sim, opsys) VALUES (?, ?, ?, ?, ?, ?)"""
-        cur = conn.cursor()
-        cur.execute(sql, (uid, name, archive, path, sim, opsys))
-        conn.commit()
-        print(cur.lastrowid)
+        with transaction() as cur:
+            cur.execute(sql, (uid, name, archive, path, sim, opsys))
+            log.debug("row => %s", cur.lastrowid)
     except sqlite3.Error as e:
-        print(e)
+        log.error(e)
+
+
+def upsert_addons(rows):
+    # rows of (uid, name, archive, path, sim, opsys) in one transaction
+    try:
+        sql = """INSERT OR REPLACE INTO addons(id, name, archive, path, sim, opsys) VALUES (?, ?, ?, ?, ?, ?)"""
+        with transaction() as cur:
+            cur.executemany(sql, rows)
+            log.debug("rows => %s", cur.rowcount)
+    except sqlite3.Error as e:
+        log.error(e)
 
 
 def create_addon(name, archive, path, sim, opsys):
+    # id of the new addon, None if it was not added
     try:
         sql = """INSERT INTO addons(name, archive, path, sim, opsys) VALUES (?, ?, ?, ?, ?)"""
-        cur = conn.cursor()
-        cur.execute(sql, (name, archive, path, sim, opsys))
-        conn.commit()
-        print(cur.lastrowid)
+        with transaction() as cur:
+            cur.execute(sql, (name, archive, path, sim, opsys))
+            log.debug("row => %s", cur.lastrowid)
+            return cur.lastrowid
     except sqlite3.Error as e:
-        print(e)
+        log.error(e)
+        return None
 
 
 def delete_addon(uid):
     try:
         sql = """DELETE FROM addons WHERE id = ?"""
-        cur = conn.cursor()
-        cur.execute(sql, (uid,))
-        conn.commit()
-        print(cur.lastrowid)
+        with transaction() as cur:
+            cur.execute(sql, (uid,))
+            cur.execute("DELETE FROM manifest WHERE addon_id = ?", (uid,))
+            log.debug("row => %s", cur.lastrowid)
     except sqlite3.Error as e:
-        print(e)
+        log.error(e)
+
+
+def wait_step(driver, step, condition="element_to_be_clickable", **fields):
+    # wait until the element of a download step is ready, fields fill placeholders like {name}
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.support import expected_conditions
+    from selenium.webdriver.support.ui import WebDriverWait
+    by, value, timeout = locators[step]
+    value = value.format(**fields)
+    log.debug("step '%s' => %s=%s", step, by, value)
+    try:
+        with span("selenium " + step, **fields):
+            return WebDriverWait(driver, timeout).until(getattr(expected_conditions, condition)((by, value)))
+    except TimeoutException:
+        raise DownloadError("step '" + step + "' timed out after " + str(timeout) + "s waiting for " + by + "=" + value)
+
+
+def get_download_files():
+    # name => (size, mtime) of the files in the download directory
+    files = {}
+    try:
+        with os.scandir(Addon.download) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    stat = entry.stat()
+                    files[entry.name] = (stat.st_size, stat.st_mtime_ns)
+    except OSError as err:
+        log.error(err)
+    return files
+
+
+@timed
+def wait_downloads(items, before, cancel=None, callback=None):
+    # an archive is complete when it has no .crdownload partner and its size is stable between two polls,
+    # callback(addon, name) is called for each complete archive while the other downloads continue
+    deadline = time.monotonic() + download_timeout
+    report = {addon.uid: 1 for addon in items}
+    pending = list(items)
+    sizes = {}
+    while pending and time.monotonic() < deadline and not (cancel and cancel.is_set()):
+        time.sleep(0.5)
+        files = get_download_files()
+        for addon in list(pending):
+            for name, (size, mtime) in files.items():
+                if before.get(name) == (size, mtime) or not fnmatch.fnmatch(name, addon.archive):
+                    continue
+                if name + ".crdownload" in files or size == 0:
+                    continue
+                if sizes.get(name) == size:
+                    log.info("downloaded '%s' for addon '%s'.", name, addon.name)
+                    report[addon.uid] = 0
+                    pending.remove(addon)
+                    if callback:
+                        callback(addon, name)
+                    break
+                sizes[name] = size
+    for addon in pending:
+        log.warning("download of '%s' for addon '%s' is not complete.", addon.archive, addon.name)
+    return report
 
 
-def download():
-    print("found", len(addons), "addons.")
-    if len(addons) > 0:
-        for addon in addons:
-            print("- " + addon.to_string())
+@recorded("download")
+def download(cancel=None, force=False, items=None, callback=None):
+    items = addons if items is None else items
+    log.info("found %d addons.", len(items))
+    # addons already on the current cycle are not downloaded again
+    scan_archives(items)
+    items = [addon for addon in items if force or not is_current(addon)]
+    log.info("download %d addons.", len(items))
+    if len(items) > 0:
+        for addon in items:
+            log.info("- %s", addon.to_string())
             # - FlightFactor A320Ultimate, ...
             # - X-Plane 11 (11.50+), ...
             # - X-Plane GNS430, ...
+        # selenium is imported on first use, it is the slowest import of the app
+        from selenium import webdriver
+        from selenium.common.exceptions import WebDriverException
+        from selenium.webdriver.common.action_chains import ActionChains
         # setup_method
         # prefs = {"profile.default_content_setting_values.notifications": 2}
         prefs = {
@@ -196,84 +712,157 @@ def download():
             "download.directory_upgrade": True,
             "profile.managed_default_content_settings.notifications": 2,
             "excludeSwitches": ["disable-popup-blocking"],
-            "download_bubble.partial_view_enabled": False
+            "download_bubble.partial_view_enabled": False,
+            "profile.default_content_setting_values.automatic_downloads": 1
         }
         options = webdriver.ChromeOptions()
         options.add_experimental_option("prefs", prefs)
         options.add_argument("--start-maximized")
         options.add_argument("--disable-search-engine-choice-screen")
-        driver = webdriver.Chrome(options=options)
-        actions = ActionChains(driver)
-        # Step # | name | target | value
-        # 1 | open | / |
-        driver.get("https://navigraph.com/")
-        # 2 | setWindowSize | 1600x900 |
-        # driver.set_window_size(1600, 900)
-        # 3 | click | linkText=Accept all cookies |
-        time.sleep(3)
-        # driver.find_element(By.LINK_TEXT, "Accept all cookies").click()
-        driver.find_element(By.XPATH, '//*[@id="consent"]/div/div/a[2]').click()
-        # 4 | pause | 3000 |
-        time.sleep(3)
-        # 5 | click | css=.sign-in > span |
-        driver.find_element(By.CLASS_NAME, 'login').click()
-        # 6 | pause | 3000 |
-        time.sleep(3)
-        # 7 | type | id=username | username
-        driver.find_element(By.ID, "username").send_keys(Addon.username)
-        # 8 | type | id=password | password
-        driver.find_element(By.ID, "password").send_keys(base64.b64decode(Addon.password).decode('utf-8'))
-        # 9 | click | id=login-id |
-        driver.find_element(By.ID, "login-id").click()
-        # 10 | pause | 5000 |
-        time.sleep(5)
-        # 11 | click | linkText=Downloads |
-        driver.find_element(By.LINK_TEXT, "Downloads").click()
-        # 12 | pause | 3000 |
-        time.sleep(10)
-
-        for addon in addons:
-            # 13 | click | xpath=//*[contains(text(),'X-Plane 11 (11.50+)')]/../td[4]/*[contains(text(),'Linux')] |
-            element = driver.find_element(By.XPATH, "//*[contains(text(),\'" + addon.name + "\')]/../td[4]/*[contains(text(),\'" + addon.opsys + "\')]")
-            print(addon.name + "/" + addon.opsys + " element.location => " + json.dumps(element.location))
-            actions.move_to_element(element).perform()
-            element.click()
-            # 14 | pause | 10000 |
-            time.sleep(10)
-
-        # 19 | click | css=.sign-in |
-        driver.find_element(By.XPATH, '//a[@href="/account"]').click()
-        # 20 | pause | 3000 |
-        time.sleep(5)
-        # 21 | click | css=.logout:nth-child(1) |
-        driver.find_element(By.LINK_TEXT, 'Sign out').click()
-        # 22 | pause | 3000 |
-        time.sleep(5)
-        # 23 | close |  |
-        driver.close()
-        # teardown_method
-        driver.quit()
+        if headless:
+            options.add_argument("--headless=new")
+            options.add_argument("--window-size=1600,900")
+        report = {addon.uid: 1 for addon in items}
+        try:
+            driver = webdriver.Chrome(options=options)
+        except WebDriverException as err:
+            log.error("download failed: %s", err)
+            return report
+        try:
+            actions = ActionChains(driver)
+            # 1 | open | / |
+            driver.get("https://navigraph.com/")
+            # 2 | click | Accept all cookies |
+            wait_step(driver, "consent").click()
+            # 3 | click | Sign in |
+            wait_step(driver, "login").click()
+            # 4 | type | username, password | click | Log in |
+            wait_step(driver, "username", "visibility_of_element_located").send_keys(Addon.username)
+            wait_step(driver, "password", "visibility_of_element_located").send_keys(base64.b64decode(Addon.password).decode('utf-8'))
+            wait_step(driver, "submit").click()
+            # 5 | click | Downloads |
+            wait_step(driver, "downloads").click()
+            before = get_download_files()
+            for addon in items:
+                # 6 | click | xpath=//*[contains(text(),'X-Plane 11 (11.50+)')]/../td[4]/*[contains(text(),'Linux')] |
+                element = wait_step(driver, "addon", name=addon.name, opsys=addon.opsys)
+                log.debug("%s/%s element.location => %s", addon.name, addon.opsys, json.dumps(element.location))
+                actions.move_to_element(element).perform()
+                element.click()
+            # 7 | wait | all downloads are complete |
+            report = wait_downloads(items, before, cancel, callback)
+            # 8 | click | Account | click | Sign out |
+            try:
+                wait_step(driver, "account").click()
+                wait_step(driver, "logout").click()
+                wait_step(driver, "logged_out", "presence_of_element_located")
+            except (DownloadError, WebDriverException) as err:
+                log.warning("sign out failed: %s", err)
+        except (DownloadError, WebDriverException, OSError) as err:
+            log.error("download failed: %s", err)
+        finally:
+            # teardown_method
+            driver.quit()
+        return report
+    return {}
+
+
+def read_archive_index(file):
+    # cycle and revision from the index inside the zip, only the central directory and the index root are read
+    try:
+        with zipfile.ZipFile(file) as zf:
+            for name in zf.namelist():
+                if name.endswith(".index") and "/" not in name:
+                    with zf.open(name) as f:
+                        for event, elem in ElementTree.iterparse(f, events=("start",)):
+                            if elem.tag == "addon":
+                                return Index(elem.get("cycle", ""), elem.get("revision", ""))
+                            break
+    except (OSError, zipfile.BadZipFile, ElementTree.ParseError) as err:
+        log.error(err)
+    return None
+
+
+def get_archive_key(file, index):
+    # newest cycle and revision first, file modification time as tie-breaker
+    cycle = int(index.cycle) if index and index.cycle.isdigit() else -1
+    revision = int(index.revision) if index and index.revision.isdigit() else -1
+    try:
+        mtime = os.stat(file).st_mtime
+    except OSError:
+        mtime = 0
+    return cycle, revision, mtime
+
+
+@timed
+def scan_archives(items):
+    # a single pass over the download directory for all addons
+    matches = {addon.uid: [] for addon in items}
+    try:
+        with os.scandir(Addon.download) as entries:
+            for entry in entries:
+                if entry.name.startswith(".") or not entry.is_file():
+                    continue
+                for addon in items:
+                    if fnmatch.fnmatch(entry.name, addon.archive):
+                        matches[addon.uid].append(entry.path)
+    except OSError as err:
+        log.error(err)
+    indexes = {}
+    results = {}
+    for addon in items:
+        files = matches[addon.uid]
+        if len(files) > 1:
+            # several cycles downloaded, the newest archive wins
+            for file in files:
+                if file not in indexes:
+                    indexes[file] = read_archive_index(file)
+            files = [max(files, key=lambda file: get_archive_key(file, indexes[file]))]
+        if len(files) == 1:
+            addon.file = files[0]
+            log.info("found '%s' addon archive.", addon.file)
+            # found '/home/bernd/Downloads/ffa320u_native_2404.zip' addon archive.
+            # found '/home/bernd/Downloads/xplane11_native_2404.zip' addon archive.
+            # found '/home/bernd/Downloads/xplane_customdata_native_2404.zip' addon archive.
+            results[addon.uid] = 0
+        else:
+            addon.file = "/path/to/zip/file"
+            results[addon.uid] = 1
+    return results
 
 
+@timed
 def get_archive(addon):
-    files = glob.glob(Addon.download + "/" + addon.archive)
-    if len(files) == 1:
-        addon.file = files[0]
-        print("found '" + addon.file + "' addon archive.")
-        # found '/home/bernd/Downloads/ffa320u_native_2404.zip' addon archive.
-        # found '/home/bernd/Downloads/xplane11_native_2404.zip' addon archive.
-        # found '/home/bernd/Downloads/xplane_customdata_native_2404.zip' addon archive.
-        return 0
-    else:
-        addon.file = "/path/to/zip/file"
-        return 1
+    return scan_archives([addon])[addon.uid]
 
 
+def get_index_files(path):
+    # the index files of a directory only change when the directory mtime changes
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return []
+    try:
+        row = get_connection().execute("SELECT files FROM index_dirs WHERE path = ? AND mtime = ?", (path, mtime)).fetchone()
+        if row:
+            return row[0].split("\n") if row[0] else []
+    except sqlite3.Error as e:
+        log.error(e)
+    files = glob.glob(path + "/*.index")
+    try:
+        with transaction() as cur:
+            cur.execute("INSERT OR REPLACE INTO index_dirs(path, mtime, files) VALUES (?, ?, ?)", (path, mtime, "\n".join(files)))
+    except sqlite3.Error as e:
+        log.error(e)
+    return files
+
+
+@timed
 def get_index(addon):
-    files = glob.glob(addon.path + "/*.index")
+    files = get_index_files(addon.path)
     if len(files) == 1:
         addon.idx = files[0]
-        print("found '" + addon.idx + "' addon index.")
+        log.info("found '%s' addon index.", addon.idx)
         # found '/home/bernd/X-Plane11/Aircraft/FlightFactor A320 ultimate/65cf4439-6c3c-425b-8640-4d77bc17d7aa.index' addon index.
         # found '/home/bernd/X-Plane11/Custom Data/4230ddbd-2639-4c16-a7e3-f3d3f4421dc3.index' addon index.
         # found '/home/bernd/X-Plane11/Custom Data/GNS430/2edd1319-de94-491d-91c5-80b4afd2db6a.index' addon index.
@@ -281,87 +870,1098 @@ def get_index(addon):
         addon.idx = "/path/to/index/file"
 
 
+def parse_index(idx, sim):
+    # read the index once as a stream, cleared elements keep memory flat for large indexes
+    index = Index()
+    root = None
+    found = False
+    # directory prefixes while inside the mapping of the simulator
+    prefixes = None
+    for event, elem in ElementTree.iterparse(idx, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+                if elem.tag == "addon":
+                    index.cycle = elem.get("cycle", "")
+                    index.revision = elem.get("revision", "")
+            elif elem.tag == "mapping":
+                # only the first mapping of the simulator is used
+                if not found and elem.get("simulator") == sim:
+                    found = True
+                    prefixes = ["/"]
+            elif prefixes and elem.tag == "directory":
+                prefixes.append(prefixes[-1] + elem.get("name", "") + "/")
+            elif prefixes and elem.tag == "files":
+                index.files.append(prefixes[-1] + elem.get("destination", ""))
+        else:
+            if elem.tag == "mapping":
+                prefixes = None
+                root.clear()
+            elif prefixes and elem.tag == "directory":
+                prefixes.pop()
+            elem.clear()
+    return index
+
+
+def load_index(idx, sim):
+    # cached index unless mtime or size of the index file changed
+    stat = os.stat(idx)
+    try:
+        row = get_connection().execute("SELECT cycle, revision, files FROM indexes WHERE path = ? AND sim = ? AND mtime = ? AND size = ?",
+                                       (idx, sim, stat.st_mtime_ns, stat.st_size)).fetchone()
+        if row:
+            return Index(row[0], row[1], row[2].split("\n") if row[2] else [])
+    except sqlite3.Error as e:
+        log.error(e)
+    index = parse_index(idx, sim)
+    try:
+        with transaction() as cur:
+            cur.execute("INSERT OR REPLACE INTO indexes(path, sim, mtime, size, cycle, revision, files) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (idx, sim, stat.st_mtime_ns, stat.st_size, index.cycle, index.revision, "\n".join(index.files)))
+    except sqlite3.Error as e:
+        log.error(e)
+    return index
+
+
+def forget_index(idx):
+    try:
+        with transaction() as cur:
+            cur.execute("DELETE FROM indexes WHERE path = ?", (idx,))
+    except sqlite3.Error as e:
+        log.error(e)
+
+
+@timed
 def get_cycle(addon):
     if addon.idx != "/path/to/index/file":
-        doc = xml.dom.minidom.parse(addon.idx)
-        root = doc.documentElement
-        if root.tagName == "addon":
-            addon.cycle = root.getAttribute("cycle")
-            addon.revision = root.getAttribute("revision")
-        print("- " + addon.to_string())
+        index = load_index(addon.idx, addon.sim)
+        addon.cycle = index.cycle
+        addon.revision = index.revision
+        log.info("- %s", addon.to_string())
         # - FlightFactor A320Ultimate, ...
         # - X-Plane 11 (11.50+), ...
         # - X-Plane GNS430, ...
 
 
-def del_index(addon):
-    if addon.idx != "/path/to/index/file" and addon.file != "/path/to/zip/file":
-        path = str(addon.idx[:addon.idx.rindex("/")])
-        print("path => " + path)
-        mapping = {}
-        doc = xml.dom.minidom.parse(addon.idx)
-        for node1 in doc.getElementsByTagName("mapping"):
-            if node1.getAttribute("simulator") == addon.sim:
-                mapping = node1
-                break
-        for node2 in mapping.getElementsByTagName("files"):
-            file = path + get_directory(node2) + node2.getAttribute("destination")
-            print("delete file '" + file + "' ...")
+@timed
+def get_obsolete(addon):
+    # files of the previous install missing in the new archive, taken before the swap replaces the old index
+    if addon.idx == "/path/to/index/file" or addon.file == "/path/to/zip/file":
+        return []
+    path = str(addon.idx[:addon.idx.rindex("/")])
+    log.debug("path => %s", path)
+    # files contained in the new archive are kept, they are replaced by the swap of the staged install
+    keep = get_members(addon) if zipfile.is_zipfile(addon.file) else set()
+    manifest = get_manifest(addon)
+    if manifest:
+        # the files recorded by the last install
+        files = [os.path.join(addon.path, row[0]) for row in manifest]
+    else:
+        files = [path + file for file in load_index(addon.idx, addon.sim).files]
+    idx = os.path.normpath(addon.idx)
+    files = [file for file in files if os.path.normpath(file) not in keep and os.path.normpath(file) != idx]
+    if idx not in keep:
+        files.append(addon.idx)
+    return files
+
+
+@timed
+def del_index(addon, files=None):
+    # files of get_obsolete(), install_members() collects them before the swap
+    if files is None:
+        files = get_obsolete(addon)
+    progress = Progress("delete", addon, total_files=len(files))
+    for file in files:
+        log.debug("delete file '%s' ...", file)
+        try:
+            os.remove(file)
+        except FileNotFoundError:
+            pass
+        except OSError as err:
+            log.error(err)
+        progress.advance()
+    progress.emit()
+    if addon.idx in files:
+        forget_index(addon.idx)
+
+
+def is_incremental(addon):
+    return incremental and addon.file != "/path/to/zip/file" and zipfile.is_zipfile(addon.file)
+
+
+def get_target(path, name):
+    # destination of an archive member, absolute and parent parts are dropped like zipfile does
+    parts = [part for part in name.split("/") if part not in ("", ".", "..")]
+    return os.path.normpath(os.path.join(path, *parts))
+
+
+def get_members(addon):
+    with zipfile.ZipFile(addon.file) as zf:
+        return {get_target(addon.path, info.filename) for info in zf.infolist() if not info.is_dir()}
+
+
+def get_crc(file):
+    crc = 0
+    with open(file, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def is_unchanged(info, file):
+    # compare size and CRC32 from the zip central directory with the file on disk
+    try:
+        if os.path.getsize(file) != info.file_size:
+            return False
+        return get_crc(file) == info.CRC
+    except OSError:
+        return False
+
+
+def get_buffer():
+    # one bounded buffer per thread, reused for every member
+    buffer = getattr(extract_local, "buffer", None)
+    if buffer is None or len(buffer) != extract_buffer:
+        buffer = extract_local.buffer = memoryview(bytearray(extract_buffer))
+    return buffer
+
+
+def get_local_zip(file, local, opened, opened_lock):
+    # one ZipFile per worker thread, the caller closes the opened ones
+    zf = getattr(local, "zf", None)
+    if zf is None:
+        zf = local.zf = zipfile.ZipFile(file)
+        with opened_lock:
+            opened.append(zf)
+    return zf
+
+
+def extract_member(zf, info, file):
+    # stream a member through the reused buffer into the staging directory, its directory exists already
+    buffer = get_buffer()
+    # ZipFile counts its open members without a lock, worker threads open and close them one at a time
+    with extract_lock:
+        src = zf.open(info)
+    try:
+        with open(file, "wb") as dst:
+            while True:
+                size = src.readinto(buffer)
+                if not size:
+                    break
+                dst.write(buffer[:size])
+            if durability == "fsync":
+                dst.flush()
+                os.fsync(dst.fileno())
+    finally:
+        with extract_lock:
+            src.close()
+
+
+def sync_fs(path):
+    # flush the file system of path once instead of every file
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if ctypes.CDLL(None, use_errno=True).syncfs(fd) != 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()), path)
+    except (AttributeError, OSError) as err:
+        log.debug("syncfs failed, sync instead: %s", err)
+        os.sync()
+    finally:
+        os.close(fd)
+
+
+def reflink(src, dst):
+    # FICLONE shares the extents of src on copy-on-write filesystems like btrfs and xfs
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        fcntl.ioctl(d.fileno(), 0x40049409, s.fileno())
+
+
+def link_member(src, file):
+    # hardlink, reflink or copy an extracted member to a further destination
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    if os.path.exists(file) and os.path.samefile(src, file):
+        # already in place, e.g. a snapshot hardlink of an unchanged file
+        return
+    temp = file + ".lnxngfmsdm"
+    try:
+        os.link(src, temp)
+    except OSError:
+        try:
+            reflink(src, temp)
+        except OSError:
+            shutil.copyfile(src, temp)
+    os.replace(temp, file)
+    # rename() does nothing if both names are links to the same file
+    if os.path.lexists(temp):
+        os.remove(temp)
+
+
+def check_members(file, names, local, opened, opened_lock):
+    # read members to the end, ZipExtFile compares the CRC-32 at EOF
+    zf = get_local_zip(file, local, opened, opened_lock)
+    buffer = get_buffer()
+    for name in names:
+        with zf.open(name) as f:
+            while f.readinto(buffer):
+                pass
+
+
+@timed
+def check_archive(file, workers=None):
+    # CRC check of every member, "" if the archive is intact, cached by path, size and mtime
+    try:
+        stat = os.stat(file)
+        row = get_connection().execute("SELECT error FROM archive_checks WHERE path = ? AND size = ? AND mtime = ?",
+                                       (file, stat.st_size, stat.st_mtime_ns)).fetchone()
+        if row:
+            return row[0]
+    except OSError as err:
+        return str(err)
+    except sqlite3.Error as e:
+        log.error(e)
+    error = ""
+    local = threading.local()
+    opened = []
+    opened_lock = threading.Lock()
+    try:
+        with zipfile.ZipFile(file) as zf:
+            infos = [info for info in zf.infolist() if not info.is_dir()]
+        # large members are tasks of their own, small ones are grouped, zlib releases the GIL while decompressing
+        chunks = [[]]
+        size = 0
+        for info in sorted(infos, key=lambda info: -info.compress_size):
+            if size >= check_chunk:
+                chunks.append([])
+                size = 0
+            chunks[-1].append(info.filename)
+            size += info.compress_size
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+            futures = [executor.submit(check_members, file, names, local, opened, opened_lock) for names in chunks if names]
+            for future in as_completed(futures):
+                future.result()
+    except (OSError, EOFError, zipfile.BadZipFile, zlib.error, NotImplementedError) as err:
+        error = str(err) or type(err).__name__
+    finally:
+        for zf in opened:
+            zf.close()
+    if error:
+        log.error("archive '%s' is damaged: %s", file, error)
+    else:
+        log.info("archive '%s' is intact, %d members checked.", file, len(infos))
+    try:
+        with transaction() as cur:
+            cur.execute("INSERT OR REPLACE INTO archive_checks(path, size, mtime, error, checked) VALUES (?, ?, ?, ?, ?)",
+                        (file, stat.st_size, stat.st_mtime_ns, error, time.time()))
+    except sqlite3.Error as e:
+        log.error(e)
+    return error
+
+
+def get_archive_size(addon):
+    # uncompressed size from the zip central directory
+    try:
+        with zipfile.ZipFile(addon.file) as zf:
+            return sum(info.file_size for info in zf.infolist())
+    except (OSError, zipfile.BadZipFile):
+        return 0
+
+
+def get_manifest(addon, cycle=None):
+    # (path, size, mtime, crc) of the files written by the last install or by the install of cycle
+    try:
+        cur = get_connection().cursor()
+        if cycle is None:
+            row = cur.execute("SELECT cycle FROM manifest WHERE addon_id = ? ORDER BY installed DESC LIMIT 1", (addon.uid,)).fetchone()
+            if not row:
+                return []
+            cycle = row[0]
+        cur.execute("SELECT path, size, mtime, crc FROM manifest WHERE addon_id = ? AND cycle = ?", (addon.uid, cycle))
+        return cur.fetchall()
+    except sqlite3.Error as e:
+        log.error(e)
+        return []
+
+
+def set_manifest(addon, cycle, rows):
+    # the previous cycle is kept, older cycles are dropped
+    installed = time.time()
+    try:
+        with transaction() as cur:
+            cur.execute("DELETE FROM manifest WHERE addon_id = ? AND cycle = ?", (addon.uid, cycle))
+            cur.executemany("INSERT INTO manifest(addon_id, cycle, path, size, mtime, crc, installed) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            [(addon.uid, cycle, *row, installed) for row in rows])
+            cur.execute("""DELETE FROM manifest WHERE addon_id = ? AND cycle NOT IN (
+                               SELECT cycle FROM manifest WHERE addon_id = ? GROUP BY cycle ORDER BY MAX(installed) DESC LIMIT 2)""",
+                        (addon.uid, addon.uid))
+    except sqlite3.Error as e:
+        log.error(e)
+
+
+def get_manifest_cycles(addon):
+    # cycles with a manifest, the installed cycle first
+    try:
+        cur = get_connection().execute("SELECT cycle FROM manifest WHERE addon_id = ? GROUP BY cycle ORDER BY MAX(installed) DESC",
+                                        (addon.uid,))
+        return [row[0] for row in cur.fetchall()]
+    except sqlite3.Error as e:
+        log.error(e)
+        return []
+
+
+def get_work_dir(addon, name):
+    # staging and snapshot directories inside the install path, on the same file system for the renames
+    return os.path.join(addon.path, ".lnxngfmsdm", name)
+
+
+def get_snapshot(addon):
+    # (cycle, directory) of the snapshot of an addon, None without snapshot
+    try:
+        with os.scandir(os.path.join(addon.path, ".lnxngfmsdm")) as entries:
+            for entry in entries:
+                if entry.name.startswith("snapshot-") and entry.is_dir():
+                    return entry.name[len("snapshot-"):], entry.path
+    except OSError:
+        pass
+    return None
+
+
+@timed
+def snapshot(addon):
+    # hardlinks of the installed files, the swap replaces the names and the snapshot keeps the old files
+    cycles = get_manifest_cycles(addon)
+    if cycles:
+        cycle = cycles[0]
+        files = [row[0] for row in get_manifest(addon, cycle)]
+    elif addon.idx != "/path/to/index/file":
+        cycle = addon.cycle
+        path = addon.idx[:addon.idx.rindex("/")]
+        files = [os.path.relpath(path + file, addon.path) for file in load_index(addon.idx, addon.sim).files + [addon.idx[len(path):]]]
+    else:
+        return
+    temp = get_work_dir(addon, "snapshot.tmp")
+    shutil.rmtree(temp, ignore_errors=True)
+    for file in files:
+        dst = os.path.join(temp, file)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        try:
+            os.link(os.path.join(addon.path, file), dst)
+        except FileNotFoundError:
+            continue
+        except OSError:
+            # file systems without hardlinks
+            shutil.copy2(os.path.join(addon.path, file), dst)
+    previous = get_snapshot(addon)
+    if previous:
+        shutil.rmtree(previous[1], ignore_errors=True)
+    os.rename(temp, get_work_dir(addon, "snapshot-" + cycle))
+    log.info("snapshot of '%s' cycle %s with %d files.", addon.name, cycle, len(files))
+
+
+@recorded("rollback")
+def rollback(addon):
+    # restore the cycle of the snapshot by renaming hardlinks into place, nothing is extracted
+    previous = get_snapshot(addon)
+    if not previous:
+        log.error("addon '%s' has no snapshot to roll back to.", addon.name)
+        return 1
+    cycle, directory = previous
+    get_index(addon)
+    current = get_manifest(addon)
+    rows = get_manifest(addon, cycle)
+    crcs = {row[0]: row[3] for row in rows}
+    restored = []
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            src = os.path.join(root, name)
+            path = os.path.relpath(src, directory)
+            link_member(src, os.path.join(addon.path, path))
+            stat = os.stat(src)
+            restored.append((path, stat.st_size, stat.st_mtime_ns, crcs[path] if path in crcs else get_crc(src)))
+    keep = {row[0] for row in restored}
+    for row in current:
+        if row[0] not in keep:
             try:
-                os.remove(file)
+                os.remove(os.path.join(addon.path, row[0]))
+            except FileNotFoundError:
+                pass
             except OSError as err:
-                print(err)
-        os.remove(addon.idx)
+                log.error(err)
+    if addon.idx != "/path/to/index/file" and os.path.relpath(addon.idx, addon.path) not in keep:
+        forget_index(addon.idx)
+    set_manifest(addon, cycle, restored)
+    get_index(addon)
+    get_cycle(addon)
+    log.info("rolled back '%s' to cycle %s with %d files.", addon.name, cycle, len(restored))
+    return 0
+
+
+def get_size(file):
+    try:
+        return os.lstat(file).st_size
+    except OSError:
+        return None
+
+
+def get_free_space(path):
+    # free bytes and device of the file system of path, the install path may not exist yet
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return shutil.disk_usage(path).free, os.stat(path).st_dev
+
+
+def new_plan(addon, index):
+    result = {"uid": addon.uid, "name": addon.name, "file": addon.file, "path": addon.path, "from_cycle": addon.cycle,
+              "cycle": index.cycle, "revision": index.revision, "valid": True, "error": "", "delete": [], "add": [], "overwrite": [],
+              "delete_bytes": 0, "add_bytes": 0, "net_bytes": 0, "required_bytes": 0, "free_bytes": 0, "device": 0, "fits": False}
+    return result
+
+
+@timed
+def plan(addon):
+    # dry run of an update from the old manifest or index and the central directory of the new archive, nothing is written
+    if addon.file == "/path/to/zip/file":
+        return None
+    if not zipfile.is_zipfile(addon.file) and tarfile.is_tarfile(addon.file):
+        # other archive formats are unpacked by shutil without a plan
+        return None
+    result = new_plan(addon, read_archive_index(addon.file) or Index())
+    try:
+        with zipfile.ZipFile(addon.file) as zf:
+            new = {get_target(addon.path, info.filename): info.file_size for info in zf.infolist() if not info.is_dir()}
+    except (OSError, zipfile.BadZipFile) as err:
+        log.error("archive '%s' is not readable: %s", addon.file, err)
+        result["valid"] = False
+        result["error"] = "archive damaged: " + str(err)
+        return result
+    error = check_archive(addon.file)
+    if error:
+        result["valid"] = False
+        result["error"] = "archive damaged: " + error
+        return result
+    old = {}
+    manifest = get_manifest(addon)
+    if manifest:
+        old = {os.path.normpath(os.path.join(addon.path, row[0])): row[1] for row in manifest}
+    elif addon.idx != "/path/to/index/file":
+        path = addon.idx[:addon.idx.rindex("/")]
+        for file in [path + file for file in load_index(addon.idx, addon.sim).files] + [addon.idx]:
+            size = get_size(file)
+            if size is not None:
+                old[os.path.normpath(file)] = size
+    existing = 0
+    for file in new:
+        size = old[file] if file in old else get_size(file)
+        if size is None:
+            result["add"].append(file)
+        else:
+            result["overwrite"].append(file)
+            existing += size
+    delete = [file for file in old if file not in new]
+    result["delete"] = sorted(delete)
+    result["delete_bytes"] = sum(old[file] for file in delete)
+    result["add_bytes"] = sum(new.values())
+    result["net_bytes"] = result["add_bytes"] - existing - result["delete_bytes"]
+    # the new files are staged next to the old ones and the snapshot keeps the old ones, nothing is freed by an update
+    result["required_bytes"] = result["add_bytes"]
+    result["free_bytes"], result["device"] = get_free_space(addon.path)
+    result["fits"] = result["required_bytes"] <= result["free_bytes"]
+    for key in ("delete", "add", "overwrite"):
+        result[key] = [os.path.relpath(file, addon.path) for file in sorted(result[key])]
+    return result
 
 
-def get_directory(node):
-    directory = "/"
-    while node.nodeName != "mapping":
-        node = node.parentNode
-        if node.nodeName == "directory":
-            directory = "/" + node.getAttribute("name") + directory
-    return directory
+def check_plans(plans):
+    # addons on the same file system need the sum of their required bytes
+    required = {}
+    free = {}
+    for item in plans:
+        if item is None:
+            continue
+        if not item["valid"]:
+            log.error("update of '%s' refused, %s", item["name"], item["error"])
+            return False
+        required[item["device"]] = required.get(item["device"], 0) + item["required_bytes"]
+        free[item["device"]] = item["free_bytes"]
+    for device, size in required.items():
+        if size > free[device]:
+            log.error("update refused, %.1f MB needed but only %.1f MB free.", size / 1024 ** 2, free[device] / 1024 ** 2)
+            return False
+    return True
 
 
+def plan_update(items=None, force=False):
+    # plans of the addons update_all() would install
+    items = addons if items is None else items
+    scan_archives(items)
+    plans = []
+    for addon in items:
+        # an unreadable index refuses the plan of this addon only
+        try:
+            get_index(addon)
+            get_cycle(addon)
+            if addon.file != "/path/to/zip/file" and (force or not is_installed(addon)):
+                plans.append(plan(addon))
+        except Exception as err:
+            log.error("plan of '%s' failed: %s", addon.name, err)
+            result = new_plan(addon, (read_archive_index(addon.file) if addon.file != "/path/to/zip/file" else None) or Index())
+            result["valid"] = False
+            result["error"] = "plan failed: " + str(err)
+            plans.append(result)
+    return plans
+
+
+def check_file(file, size, mtime, crc, quick):
+    try:
+        stat = os.stat(file)
+        if stat.st_size != size:
+            return "modified"
+        if quick:
+            return "ok" if stat.st_mtime_ns == mtime else "modified"
+        return "ok" if get_crc(file) == crc else "modified"
+    except OSError:
+        return "missing"
+
+
+@recorded("verify", lambda report: any(row["missing"] or row["modified"] for row in report.values()))
+def verify(items=None, workers=None, quick=False):
+    # check the installed files against the manifest, quick compares size and mtime only
+    items = addons if items is None else items
+    report = {}
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        futures = {}
+        for addon in items:
+            report[addon.uid] = {"files": 0, "missing": [], "modified": []}
+            for path, size, mtime, crc in get_manifest(addon):
+                file = os.path.join(addon.path, path)
+                futures[executor.submit(check_file, file, size, mtime, crc, quick)] = (addon, file)
+                report[addon.uid]["files"] += 1
+        for future in as_completed(futures):
+            addon, file = futures[future]
+            state = future.result()
+            if state != "ok":
+                log.warning("%s file '%s' ...", state, file)
+                report[addon.uid][state].append(file)
+    for addon in items:
+        log.info("verify '%s' => %d files, %d missing, %d modified.", addon.name, report[addon.uid]["files"],
+                 len(report[addon.uid]["missing"]), len(report[addon.uid]["modified"]))
+    return report
+
+
+def stage_member(zf, info, items, compare):
+    # stage one member for all addons, it is decompressed once and linked to further destinations
+    entries = []
+    src = None
+    counts = [0, 0, 0]
+    for addon in items:
+        file = get_target(addon.path, info.filename)
+        stage = get_target(get_work_dir(addon, "stage"), info.filename)
+        if compare and is_unchanged(info, file):
+            counts[2] += 1
+            stage = None
+        elif src is None:
+            extract_member(zf, info, stage)
+            src = stage
+            counts[0] += 1
+        else:
+            link_member(src, stage)
+            counts[1] += 1
+        entries.append((addon, stage, file, info))
+    return entries, counts
+
+
+def install_members(items, compare):
+    # members are extracted into the staging directory and renamed into place once all are written,
+    # small members are written by a thread pool while this thread streams the large ones
+    counts = [0, 0, 0]
+    staged = []
+    rows = {addon.uid: [] for addon in items}
+    for addon in items:
+        shutil.rmtree(get_work_dir(addon, "stage"), ignore_errors=True)
+    # the old manifest or index still describes the previous install, the swap replaces the index
+    obsolete = {addon.uid: get_obsolete(addon) for addon in items}
+    with zipfile.ZipFile(items[0].file) as zf:
+        infos = zf.infolist()
+        files = [info for info in infos if not info.is_dir()]
+        total = sum(info.file_size for info in files)
+        progresses = [Progress("install", addon, total, len(files)) for addon in items]
+        # the staging and install trees are created in one pass
+        directories = set()
+        for info in infos:
+            for addon in items:
+                if info.is_dir():
+                    directories.add(get_target(addon.path, info.filename))
+                else:
+                    directories.add(os.path.dirname(get_target(addon.path, info.filename)))
+                    directories.add(os.path.dirname(get_target(get_work_dir(addon, "stage"), info.filename)))
+        for directory in sorted(directories):
+            os.makedirs(directory, exist_ok=True)
+
+        def done(info, result):
+            staged.extend(result[0])
+            for i in range(3):
+                counts[i] += result[1][i]
+            for progress in progresses:
+                progress.advance(info.file_size)
+
+        # the ZipFile is shared, its reads are serialized by zipfile and the decompression runs in parallel
+        with ThreadPoolExecutor(max_workers=extract_workers) as executor:
+            futures = {executor.submit(stage_member, zf, info, items, compare): info for info in files if info.file_size < extract_small}
+            for info in files:
+                if info.file_size >= extract_small:
+                    done(info, stage_member(zf, info, items, compare))
+            for future in as_completed(futures):
+                done(futures[future], future.result())
+        for progress in progresses:
+            progress.emit()
+    log.info("staged %d files, linked %d files, skipped %d unchanged files.", *counts)
+    if durability == "syncfs":
+        # the staged data is on disk before the renames make it live
+        for path in {os.stat(addon.path).st_dev: addon.path for addon in items}.values():
+            sync_fs(path)
+    with span("swap"):
+        for addon, stage, file, info in staged:
+            if stage:
+                os.replace(stage, file)
+            rows[addon.uid].append((os.path.relpath(file, addon.path), info.file_size, os.stat(file).st_mtime_ns, info.CRC))
+        for addon in items:
+            shutil.rmtree(get_work_dir(addon, "stage"), ignore_errors=True)
+    for addon in items:
+        del_index(addon, obsolete[addon.uid])
+    index = read_archive_index(items[0].file)
+    for addon in items:
+        set_manifest(addon, index.cycle if index else "0", rows[addon.uid])
+
+
+@timed
+def install_addons(items):
+    # addons sharing one archive file are installed with a single pass over the archive
+    if items and items[0].file != "/path/to/zip/file":
+        for addon in items:
+            log.info("install addon archive '%s' to path '%s' ...", addon.file, addon.path)
+        if zipfile.is_zipfile(items[0].file):
+            install_members(items, is_incremental(items[0]))
+        else:
+            for addon in items:
+                del_index(addon)
+                shutil.unpack_archive(addon.file, addon.path)
+
+
+@timed
 def install_addon(addon):
-    if addon.file != "/path/to/zip/file":
-        print("install addon archive '" + addon.file + "' to path '" + addon.path + "' ...")
-        shutil.unpack_archive(addon.file, addon.path)
+    install_addons([addon])
+
+
+def get_object_path(digest):
+    return os.path.join(store_path, "objects", digest[:2], digest[2:])
+
+
+def hash_member(zf, info):
+    sha = hashlib.sha256()
+    with zf.open(info) as src:
+        for chunk in iter(lambda: src.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
 
 
+def write_object(zf, info, digest):
+    # objects are zlib compressed, the temporary file keeps a half written object out of the store
+    file = get_object_path(digest)
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    compressor = zlib.compressobj()
+    with zf.open(info) as src, open(file + ".tmp", "wb") as dst:
+        for chunk in iter(lambda: src.read(1024 * 1024), b""):
+            dst.write(compressor.compress(chunk))
+        dst.write(compressor.flush())
+    os.replace(file + ".tmp", file)
+    return os.path.getsize(file)
+
+
+def store_archive(addon):
+    index = read_archive_index(addon.file) or Index()
+    name = os.path.basename(addon.file)
+    size = os.path.getsize(addon.file)
+    try:
+        with store_lock, zipfile.ZipFile(addon.file) as zf:
+            cur = get_connection().cursor()
+            cur.execute("SELECT id FROM archives WHERE addon_id = ? AND name = ? AND cycle = ? AND revision = ? AND size = ?",
+                        (addon.uid, name, index.cycle, index.revision, size))
+            if cur.fetchone():
+                log.info("archive '%s' is stored already.", name)
+                return True
+            objects = []
+            members = []
+            for position, info in enumerate(zf.infolist()):
+                digest = ""
+                if not info.is_dir():
+                    digest = hash_member(zf, info)
+                    cur.execute("SELECT 1 FROM objects WHERE hash = ?", (digest,))
+                    if not cur.fetchone() or not os.path.exists(get_object_path(digest)):
+                        objects.append((digest, info.file_size, write_object(zf, info, digest)))
+                members.append((position, info.filename, digest, info.file_size, json.dumps(info.date_time), info.compress_type, info.external_attr))
+            with transaction() as cur:
+                cur.executemany("INSERT OR REPLACE INTO objects(hash, size, stored) VALUES (?, ?, ?)", objects)
+                cur.execute("INSERT INTO archives(addon_id, name, cycle, revision, size, stored) VALUES (?, ?, ?, ?, ?, ?)",
+                            (addon.uid, name, index.cycle, index.revision, size, time.time()))
+                archive_id = cur.lastrowid
+                cur.executemany("""INSERT INTO archive_members(archive_id, position, name, object, size, date_time, compress_type, external_attr) 
+                                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)""", [(archive_id, *member) for member in members])
+            log.info("stored archive '%s' with %d new of %d members.", name, len(objects), len(members))
+            prune_store()
+        return True
+    except (OSError, zipfile.BadZipFile, sqlite3.Error) as err:
+        log.error(err)
+        return False
+
+
+def delete_archive(cur, archive_id):
+    cur.execute("DELETE FROM archive_members WHERE archive_id = ?", (archive_id,))
+    cur.execute("DELETE FROM archives WHERE id = ?", (archive_id,))
+
+
+def prune_store():
+    # retention by archives per addon and by total size, the newest archive of an addon is always kept
+    with transaction() as cur:
+        cur.execute("""SELECT id FROM (SELECT id, ROW_NUMBER() OVER (PARTITION BY addon_id 
+                           ORDER BY CAST(cycle AS INTEGER) DESC, CAST(revision AS INTEGER) DESC, stored DESC) AS number FROM archives) 
+                       WHERE number > ?""", (store_keep,))
+        for row in cur.fetchall():
+            delete_archive(cur, row[0])
+        cur.execute("""SELECT id FROM archives WHERE id NOT IN (SELECT MAX(id) FROM archives GROUP BY addon_id) ORDER BY stored""")
+        for row in cur.fetchall():
+            cur.execute("SELECT COALESCE(SUM(stored), 0) FROM objects WHERE hash IN (SELECT object FROM archive_members)")
+            if cur.fetchone()[0] <= store_max_bytes:
+                break
+            delete_archive(cur, row[0])
+        cur.execute("SELECT hash FROM objects WHERE hash NOT IN (SELECT object FROM archive_members)")
+        digests = [row[0] for row in cur.fetchall()]
+        cur.executemany("DELETE FROM objects WHERE hash = ?", [(digest,) for digest in digests])
+    for digest in digests:
+        try:
+            os.remove(get_object_path(digest))
+        except OSError as err:
+            log.error(err)
+    log.info("pruned %d objects from the archive store.", len(digests))
+
+
+def get_archives(addon=None):
+    # (id, addon_id, name, cycle, revision, size, stored) of the stored archives, newest first
+    try:
+        cur = get_connection().cursor()
+        sql = "SELECT id, addon_id, name, cycle, revision, size, stored FROM archives"
+        if addon:
+            cur.execute(sql + " WHERE addon_id = ? ORDER BY stored DESC", (addon.uid,))
+        else:
+            cur.execute(sql + " ORDER BY stored DESC")
+        return cur.fetchall()
+    except sqlite3.Error as e:
+        log.error(e)
+        return []
+
+
+def rebuild_archive(archive_id, directory=None):
+    # write a stored archive as zip again, by default into the download directory
+    try:
+        cur = get_connection().cursor()
+        cur.execute("SELECT name FROM archives WHERE id = ?", (archive_id,))
+        row = cur.fetchone()
+        if not row:
+            log.error("archive %s is not stored.", archive_id)
+            return None
+        file = os.path.join(directory or Addon.download, row[0])
+        cur.execute("""SELECT name, object, size, date_time, compress_type, external_attr FROM archive_members 
+                           WHERE archive_id = ? ORDER BY position""", (archive_id,))
+        with zipfile.ZipFile(file + ".tmp", "w") as zf:
+            for name, digest, size, date_time, compress_type, external_attr in cur.fetchall():
+                info = zipfile.ZipInfo(name, tuple(json.loads(date_time)))
+                info.compress_type = compress_type
+                info.external_attr = external_attr
+                info.file_size = size
+                if not digest:
+                    zf.writestr(info, b"")
+                    continue
+                decompressor = zlib.decompressobj()
+                with open(get_object_path(digest), "rb") as src, zf.open(info, "w") as dst:
+                    for chunk in iter(lambda: src.read(1024 * 1024), b""):
+                        dst.write(decompressor.decompress(chunk))
+                    dst.write(decompressor.flush())
+        os.replace(file + ".tmp", file)
+        log.info("rebuilt archive '%s'.", file)
+        return file
+    except (OSError, zipfile.BadZipFile, zlib.error, sqlite3.Error) as err:
+        log.error(err)
+        return None
+
+
+@timed
 def backup_addon(addon):
-    if addon.file != "/path/to/zip/file":
-        print("backup addon archive '" + addon.file + "' ...")
-        os.rename(addon.file, addon.file + ".bak")
+    # several addons may share one archive, it is stored by the first one
+    if addon.file != "/path/to/zip/file" and os.path.exists(addon.file):
+        log.info("backup addon archive '%s' ...", addon.file)
+        if zipfile.is_zipfile(addon.file) and store_archive(addon):
+            os.remove(addon.file)
+        else:
+            os.rename(addon.file, addon.file + ".bak")
 
 
-def update(addon):
-    result = get_archive(addon)
-    get_index(addon)
-    del_index(addon)
-    install_addon(addon)
-    backup_addon(addon)
-    return result
+def update(addon, scanned=False, force=False):
+    # update_all() scans the download directory once for all addons
+    if not scanned:
+        get_archive(addon)
+    return update_shared([addon], force)[0][1]
+
+
+def update_shared(items, force=False):
+    # addons resolving to the same archive file, the archive is extracted and backed up once
+    results = []
+    pending = []
+    for addon in items:
+        get_index(addon)
+        get_cycle(addon)
+        if not force and is_installed(addon):
+            log.info("addon '%s' is up to date with cycle %s rev %s.", addon.name, addon.cycle, addon.revision)
+            results.append((addon, 0))
+            continue
+        pending.append(addon)
+    # nothing is deleted unless the archive is readable and the new files fit on the disk
+    if not check_plans([plan(addon) for addon in pending]):
+        return results + [(addon, 1) for addon in pending]
+    for addon in pending:
+        if addon.file != "/path/to/zip/file":
+            snapshot(addon)
+        results.append((addon, 0 if addon.file != "/path/to/zip/file" else 1))
+    install_addons(pending)
+    backup_addon(items[0])
+    return results
+
+
+def get_tree(addon, others):
+    # addons sharing a tree, e.g. 'Custom Data' and 'Custom Data/GNS430', map to the same top-most path
+    tree = os.path.realpath(addon.path)
+    for other in others:
+        path = os.path.realpath(other.path)
+        if tree.startswith(path + os.sep):
+            tree = path
+    return tree
+
+
+def get_path_lock(tree):
+    with path_locks_lock:
+        if tree not in path_locks:
+            path_locks[tree] = threading.Lock()
+        return path_locks[tree]
+
+
+def update_group(keys, items, cancel=None, force=False):
+    # addons of the same trees one after another, addons sharing an archive file together
+    results = []
+    shared = {}
+    for addon in items:
+        shared.setdefault(addon.file if addon.file != "/path/to/zip/file" else addon.uid, []).append(addon)
+    locks = [get_path_lock(key) for key in sorted(keys)]
+    for lock in locks:
+        lock.acquire()
+    try:
+        for group in shared.values():
+            if cancel and cancel.is_set():
+                for addon in group:
+                    log.info("update '%s' cancelled.", addon.name)
+                continue
+            try:
+                results.extend(update_shared(group, force))
+            except Exception as err:
+                log.error(err)
+                results.extend((addon, 1) for addon in group)
+    finally:
+        for lock in reversed(locks):
+            lock.release()
+    return results
+
+
+@recorded("update")
+def update_all(items=None, workers=None, callback=None, cancel=None, force=False):
+    # update addons concurrently, addons of the same tree or archive are updated by the same worker
+    items = addons if items is None else items
+    scan_archives(items)
+    emit("update", addons=len(items), total_bytes=sum(get_archive_size(addon) for addon in items if addon.file != "/path/to/zip/file"))
+    groups = []
+    for addon in items:
+        keys = {get_tree(addon, addons + items)}
+        if addon.file != "/path/to/zip/file":
+            keys.add(os.path.realpath(addon.file))
+        members = [addon]
+        for group in [group for group in groups if group[0] & keys]:
+            groups.remove(group)
+            keys |= group[0]
+            members = group[1] + members
+        groups.append((keys, members))
+    report = {}
+    with ThreadPoolExecutor(max_workers=workers or jobs) as executor:
+        futures = [executor.submit(update_group, keys, members, cancel, force) for keys, members in groups]
+        for future in as_completed(futures):
+            for addon, result in future.result():
+                log.info("update '%s' => %s", addon.name, result)
+                report[addon.uid] = result
+                if callback:
+                    callback(addon, result)
+    return report
+
+
+def inotify_open(path):
+    # inotify descriptor for finished writes and renames in path, None if inotify is not available
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        if libc.inotify_add_watch(fd, os.fsencode(path), inotify_mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(errno, os.strerror(errno), path)
+        return fd
+    except (OSError, AttributeError) as err:
+        log.warning("inotify is not available: %s", err)
+        return None
 
 
-def init():
+def inotify_read(fd, timeout):
+    # file names of the events, empty after timeout seconds without events
+    names = []
+    if not select.select([fd], [], [], timeout)[0]:
+        return names
+    try:
+        data = os.read(fd, 65536)
+    except BlockingIOError:
+        return names
+    offset = 0
+    while offset + 16 <= len(data):
+        # struct inotify_event: wd, mask, cookie, len, name
+        wd, mask, cookie, length = struct.unpack_from("iIII", data, offset)
+        names.append(os.fsdecode(data[offset + 16:offset + 16 + length].split(b"\0", 1)[0]))
+        offset += 16 + length
+    return names
+
+
+def get_file_stat(file):
+    try:
+        stat = os.stat(file)
+        return stat.st_size, stat.st_mtime_ns
+    except OSError:
+        return None
+
+
+def watch(items=None, cancel=None, callback=None):
+    # update the addons of each archive that lands in the download directory, until cancel is set
+    items = addons if items is None else items
+    fd = inotify_open(Addon.download)
+    log.info("watch '%s' with %s.", Addon.download, "inotify" if fd is not None else "polling")
+    known = get_download_files() if fd is None else {}
+    # name => ((size, mtime), monotonic time of the last change)
+    pending = {}
+    try:
+        while not (cancel and cancel.is_set()):
+            if fd is not None:
+                names = inotify_read(fd, 1.0)
+            else:
+                if cancel:
+                    cancel.wait(1.0 if pending else watch_interval)
+                else:
+                    time.sleep(1.0 if pending else watch_interval)
+                files = get_download_files()
+                names = [name for name, stat in files.items() if known.get(name) != stat]
+                known = files
+            for name in names:
+                if not name.startswith(".") and name not in pending and any(fnmatch.fnmatch(name, addon.archive) for addon in items):
+                    pending[name] = (None, time.monotonic())
+            for name, (last, since) in list(pending.items()):
+                file = os.path.join(Addon.download, name)
+                stat = get_file_stat(file)
+                if stat is None:
+                    del pending[name]
+                elif stat != last:
+                    pending[name] = (stat, time.monotonic())
+                elif time.monotonic() - since >= watch_settle and not (cancel and cancel.is_set()):
+                    del pending[name]
+                    if not zipfile.is_zipfile(file):
+                        log.warning("archive '%s' is not complete.", file)
+                        continue
+                    matching = [addon for addon in items if fnmatch.fnmatch(name, addon.archive)]
+                    log.info("archive '%s' landed for %d addons.", name, len(matching))
+                    report = update_all(matching, cancel=cancel)
+                    for addon in matching:
+                        get_index(addon)
+                        get_cycle(addon)
+                    if callback:
+                        callback(name, report)
+    finally:
+        if fd is not None:
+            os.close(fd)
+
+
+@recorded("download and update")
+def download_update(items=None, workers=None, cancel=None, force=False):
+    # each archive is checked and installed as soon as its download is complete, while the other downloads continue
+    items = addons if items is None else items
+    scan_archives(items)
+    # archives downloaded before are installed right away
+    ready = [addon for addon in items if addon.file != "/path/to/zip/file" and not is_installed(addon)]
+    fetch = [addon for addon in items if addon not in ready and (force or not is_current(addon))]
+    report = {}
+    futures = {}
+    # archive name => uids of the addons downloaded with it, addons sharing an archive are updated together
+    downloaded = {}
+    with ThreadPoolExecutor(max_workers=workers or jobs) as executor:
+        def schedule(group):
+            futures[executor.submit(update_all, group, None, None, cancel, force)] = group
+
+        def complete(addon, name):
+            downloaded.setdefault(name, set()).add(addon.uid)
+            group = [other for other in fetch if fnmatch.fnmatch(name, other.archive)]
+            if all(other.uid in downloaded[name] for other in group):
+                schedule(group)
+
+        if ready:
+            schedule(ready)
+        for uid, result in download(cancel, force, fetch, complete).items():
+            if result:
+                report[uid] = result
+        for future in as_completed(list(futures)):
+            try:
+                report.update(future.result())
+            except Exception as err:
+                log.error(err)
+                report.update((addon.uid, 1) for addon in futures[future])
+    return report
+
+
+def init(callback=None):
     # set_settings()
     get_settings()
     # set_addons()
     get_addons()
     # get indexes and cycles
     for addon in addons:
-        get_index(addon)
-        get_cycle(addon)
+        # a damaged index shows up in the plan of the addon
+        try:
+            get_index(addon)
+            get_cycle(addon)
+        except (OSError, ElementTree.ParseError) as err:
+            log.error("index of '%s' is not readable: %s", addon.name, err)
+        if callback:
+            callback(addon)
+
+
+def setup(path=None, callback=None):
+    # explicit initializer, importing this module has no side effects
+    connect_sqlite_db(path)
+    init(callback)
 
 
 def main():
-    download()
-    for addon in addons:
-        result = update(addon)
-        print(result)
+    report = download_update()
+    print(report)
 
 
-connect_sqlite_db()
-init()
-# main()
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    setup()
+    # main()
@@ -15,9 +15,16 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import time
+
+startup = time.perf_counter()
+
 import base64
+import logging
 import os
+import queue
 import sys
+import threading
 import webbrowser
 
 import lnxngfmsdm_core as core
@@ -26,8 +33,22 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 from ttkthemes import ThemedTk
 
+# print startup timings and exit when the addons are loaded
+startup_time = "--startup-time" in sys.argv
 wx_opsys = ["Windows", "MacOS", "Linux"]
 wx_sim = ["XP10", "XP11", "XP12"]
+# events from the background worker, polled on the Tk main thread
+events = queue.Queue()
+cancel_event = threading.Event()
+busy = False
+# bytes extracted per addon uid during an update
+update_bytes = {}
+update_total = 0
+
+
+def startup_step(name):
+    if startup_time:
+        print(f"startup {name} => {(time.perf_counter() - startup) * 1000:.0f} ms")
 
 
 def resource_path(relative_path):
@@ -43,13 +64,14 @@ def resource_path(relative_path):
 
 
 # main = tk.Tk()
+logging.basicConfig(level=logging.INFO, format="%(message)s")
 main = ThemedTk(theme="plastik")
 main.title("LNX NG FMS Data Manager")
 small_icon = tk.PhotoImage(file=resource_path("images/compass-3-32.png"))
 large_icon = tk.PhotoImage(file=resource_path("images/compass-3-256.png"))
 main.iconphoto(False, large_icon)
 main.geometry("1900x475")
-main.resizable(True, False)
+main.resizable(True, True)
 
 list_icon = tk.PhotoImage(file=resource_path("images/list-2-24.png"))
 add_row_icon = tk.PhotoImage(file=resource_path("images/add-row-24.png"))
@@ -64,14 +86,15 @@ delete_icon = tk.PhotoImage(file=resource_path("images/delete-24.png"))
 folder_icon = tk.PhotoImage(file=resource_path("images/folder-3-24.png"))
 archive_icon = tk.PhotoImage(file=resource_path("images/archive-2-24.png"))
 
+# styles
+ttk.Style(main).configure("Label.TLabel", padding=(10, 0, 0, 0))
+
 
 class AddonWidget(ttk.Frame):
-    def __init__(self, parent, addon):
+    # one row of the AddonList, rebound to another addon with set_addon() while scrolling
+    def __init__(self, parent):
         super().__init__(master=parent)
-
-        # styles
-        self.style = ttk.Style(self)
-        self.style.configure("Label.TLabel", padding=(10, 0, 0, 0))
+        self.addon = None
 
         # frame
         self["borderwidth"] = 2
@@ -80,62 +103,72 @@ class AddonWidget(ttk.Frame):
 
         # widgets
         # ---- DELETE ----
-        self.del_btn = ttk.Button(self, image=delete_icon, command=lambda: self.del_btn_pressed(addon))
+        self.del_btn = ttk.Button(self, image=delete_icon, command=lambda: self.del_btn_pressed())
         self.del_btn.grid(row=0, column=0, sticky=tk.NS, padx=10, pady=5)
         # ---- SAVE ----
-        self.save_btn = ttk.Button(self, image=save_icon, command=lambda: self.save_btn_pressed(addon), state=tk.DISABLED)
+        self.save_btn = ttk.Button(self, image=save_icon, command=lambda: self.save_btn_pressed(), state=tk.DISABLED)
         self.save_btn.grid(row=0, column=1, sticky=tk.NS, padx=0, pady=5)
         # ---- DIVIDER ----
         ttk.Separator(self, orient="vertical").grid(row=0, column=2, sticky=tk.NS, padx=10, pady=5)
         # ---- UID ----
         ttk.Label(self, text="ID:").grid(row=0, column=3, sticky=tk.NS)
         self.uid_lbl = ttk.Label(self, width=3, anchor=tk.CENTER, relief=tk.SUNKEN, borderwidth=1)
-        self.uid_lbl.config(text=addon.uid)
         self.uid_lbl.grid(row=0, column=4, sticky=tk.NS, padx=0, pady=5)
         # ---- NAME ----
         ttk.Label(self, text="SOFTWARE:", style="Label.TLabel").grid(row=0, column=5, sticky=tk.NS)
         self.name_entry = ttk.Entry(self, width=30)
-        self.name_entry.insert(0, addon.name)
         self.name_entry.bind("<KeyRelease>", self.entry_changed)
         self.name_entry.bind("<Control-a>", self.select_all)
         self.name_entry.grid(row=0, column=6, sticky=tk.NS, padx=0, pady=5)
         # ---- ARCHIVE ----
         ttk.Label(self, text="ARCHIVE:", style="Label.TLabel").grid(row=0, column=7, sticky=tk.NS)
         self.archive_entry = ttk.Entry(self, width=40)
-        self.archive_entry.insert(0, addon.archive)
         self.archive_entry.bind("<KeyRelease>", self.entry_changed)
         self.archive_entry.bind("<Control-a>", self.select_all)
         self.archive_entry.grid(row=0, column=8, sticky=tk.NS, padx=0, pady=5)
-        self.archive_btn = ttk.Button(self, image=archive_icon, command=lambda: self.archive_btn_pressed(addon))
+        self.archive_btn = ttk.Button(self, image=archive_icon, command=lambda: self.archive_btn_pressed())
         self.archive_btn.grid(row=0, column=9, sticky=tk.NS, padx=0, pady=5)
         # ---- PATH ----
         ttk.Label(self, text="INSTALL:", style="Label.TLabel").grid(row=0, column=10, sticky=tk.NS)
         self.path_entry = ttk.Entry(self, width=50)
-        self.path_entry.insert(0, addon.path)
         self.path_entry.bind("<KeyRelease>", self.entry_changed)
         self.path_entry.bind("<Control-a>", self.select_all)
         self.path_entry.grid(row=0, column=11, sticky=tk.NS, padx=0, pady=5)
-        self.path_btn = ttk.Button(self, image=folder_icon, command=lambda: self.path_btn_pressed(addon))
+        self.path_btn = ttk.Button(self, image=folder_icon, command=lambda: self.path_btn_pressed())
         self.path_btn.grid(row=0, column=12, sticky=tk.NS, padx=0, pady=5)
         # ---- OPSYS ----
         ttk.Label(self, text="OS:", style="Label.TLabel").grid(row=0, column=13, sticky=tk.NS)
         self.opsys_cbox = ttk.Combobox(self, state="readonly", values=wx_opsys, width=8)
-        self.opsys_cbox.set(addon.opsys)
         self.opsys_cbox.bind("<<ComboboxSelected>>", self.cbox_changed)
         self.opsys_cbox.grid(row=0, column=14, sticky=tk.NS, padx=0, pady=5)
         # ---- SIM ----
         ttk.Label(self, text="SIM:", style="Label.TLabel").grid(row=0, column=15, sticky=tk.NS)
         self.sim_cbox = ttk.Combobox(self, state="readonly", values=wx_sim, width=5)
-        self.sim_cbox.set(addon.sim)
         self.sim_cbox.bind("<<ComboboxSelected>>", self.cbox_changed)
         self.sim_cbox.grid(row=0, column=16, sticky=tk.NS, padx=0, pady=5)
         # ---- AIRAC ----
         ttk.Label(self, text="AIRAC:", style="Label.TLabel").grid(row=0, column=17, sticky=tk.NS)
         self.airac_lbl = ttk.Label(self, width=9, anchor=tk.CENTER, relief=tk.SUNKEN, borderwidth=1)
-        self.airac_lbl.config(text=f"{addon.cycle}rev{addon.revision}")
         self.airac_lbl.grid(row=0, column=18, sticky=tk.NS, padx=0, pady=5)
 
-        self.pack(anchor=tk.W, padx=10, pady=5)
+    def set_addon(self, addon, values=None):
+        # values are unsaved (name, archive, path, opsys, sim) kept by the AddonList
+        self.addon = addon
+        self.uid_lbl.config(text=addon.uid)
+        name, archive, path, opsys, sim = values or (addon.name, addon.archive, addon.path, addon.opsys, addon.sim)
+        for entry, value in ((self.name_entry, name), (self.archive_entry, archive), (self.path_entry, path)):
+            entry.delete(0, tk.END)
+            entry.insert(0, value)
+        self.opsys_cbox.set(opsys)
+        self.sim_cbox.set(sim)
+        self.airac_lbl.config(text=f"{addon.cycle}rev{addon.revision}")
+        self.save_btn.config(state=tk.NORMAL if values else tk.DISABLED)
+
+    def get_values(self):
+        return self.name_entry.get(), self.archive_entry.get(), self.path_entry.get(), self.opsys_cbox.get(), self.sim_cbox.get()
+
+    def is_changed(self):
+        return str(self.save_btn["state"]) == tk.NORMAL
 
     # event parameter from event object is mandatory
     def cbox_changed(self, event):
@@ -149,7 +182,8 @@ class AddonWidget(ttk.Frame):
         print("entry_changed", event)
         self.save_btn.config(state=tk.NORMAL)
 
-    def path_btn_pressed(self, addon):
+    def path_btn_pressed(self):
+        addon = self.addon
         path = filedialog.askdirectory(initialdir="~", title=f"Choose Addon ID: {addon.uid} install directory")
         print("path =>", path)
         if "/" in path:
@@ -157,7 +191,8 @@ class AddonWidget(ttk.Frame):
             self.path_entry.insert(0, path)
             self.save_btn.config(state=tk.NORMAL)
 
-    def archive_btn_pressed(self, addon):
+    def archive_btn_pressed(self):
+        addon = self.addon
         archive = filedialog.askopenfilename(initialdir="~", title=f"Choose Addon ID: {addon.uid} archive file", filetypes=(("Zip-Archive", "*.zip"),))
         print("archive =>", archive)
         if "/" in archive:
@@ -176,17 +211,18 @@ class AddonWidget(ttk.Frame):
             messagebox.showinfo("Information", "Downloads path under Settings has been updated!")
             core.get_settings()
 
-    def save_btn_pressed(self, addon):
+    def save_btn_pressed(self):
+        addon = self.addon
         if self.name_entry.get() and self.archive_entry.get() and self.path_entry.get() and self.sim_cbox.get() and self.opsys_cbox.get():
             self.save_btn.config(state=tk.DISABLED)
             core.upsert_addon(addon.uid, self.name_entry.get(), self.archive_entry.get(), self.path_entry.get(), self.sim_cbox.get(), self.opsys_cbox.get())
             messagebox.showinfo("Information", f"Addon ID: {addon.uid} is saved!")
-            core.init()
+            refresh()
         else:
             messagebox.showerror("Error", f"Addon ID: {addon.uid} is missing value/s!")
 
-    @staticmethod
-    def del_btn_pressed(addon):
+    def del_btn_pressed(self):
+        addon = self.addon
         result = messagebox.askquestion("Question", f"Are you sure that you want to delete the Addon ID: {addon.uid} list item?")
         print(result)
         if result == "yes":
@@ -209,10 +245,6 @@ class SettingsWidget(ttk.Frame):
     def __init__(self, parent):
         super().__init__(master=parent)
 
-        # styles
-        self.style = ttk.Style(self)
-        self.style.configure("Label.TLabel", padding=(10, 0, 0, 0))
-
         # frame
         self["borderwidth"] = 2
         self["relief"] = "solid"
@@ -247,6 +279,9 @@ class SettingsWidget(ttk.Frame):
         self.downloads_entry.grid(row=0, column=11, sticky=tk.NS, padx=0, pady=5)
         self.downloads_btn = ttk.Button(self, image=folder_icon, command=lambda: self.downloads_btn_pressed())
         self.downloads_btn.grid(row=0, column=12, sticky=tk.NS, padx=0, pady=5)
+        # ---- HEADLESS ----
+        self.headless = tk.BooleanVar(value=core.headless)
+        ttk.Checkbutton(self, text="HEADLESS", variable=self.headless, command=lambda: self.save_btn.config(state=tk.NORMAL)).grid(row=0, column=13, sticky=tk.NS, padx=10, pady=5)
 
         self.pack(anchor=tk.W, padx=10, pady=5)
 
@@ -266,7 +301,7 @@ class SettingsWidget(ttk.Frame):
     def save_btn_pressed(self):
         if self.downloads_entry.get() and self.username_entry.get() and self.password_entry.get():
             self.save_btn.config(state=tk.DISABLED)
-            core.upsert_setting(self.downloads_entry.get(), self.username_entry.get(), base64.b64encode(self.password_entry.get().encode("utf-8")).decode("utf-8"))
+            core.upsert_setting(self.downloads_entry.get(), self.username_entry.get(), base64.b64encode(self.password_entry.get().encode("utf-8")).decode("utf-8"), self.headless.get())
             messagebox.showinfo("Information", "Settings are saved!")
             core.get_settings()
         else:
@@ -284,6 +319,141 @@ class SettingsWidget(ttk.Frame):
         return 'break'
 
 
+class AddonList(ttk.Frame):
+    # renders only the visible rows, a fixed pool of AddonWidget rows is rebound to the addons while scrolling
+    def __init__(self, container):
+        super().__init__(container)
+        self.items = []
+        self.top = 0
+        self.rows = []
+        self.row_height = 0
+        # unsaved row values by addon uid, kept while the row shows another addon
+        self.changes = {}
+        self.canvas = tk.Canvas(self, highlightthickness=0)
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.yview)
+        scrollbar_h = ttk.Scrollbar(self, orient="horizontal", command=self.canvas.xview)
+        self.rows_frame = ttk.Frame(self.canvas)
+        self.rows_frame.bind("<Configure>", lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all")))
+        self.canvas.create_window((0, 0), window=self.rows_frame, anchor="nw")
+        self.canvas.configure(xscrollcommand=scrollbar_h.set)
+        self.canvas.bind("<Configure>", lambda e: self.render())
+        scrollbar_h.pack(side="bottom", fill="x")
+        self.scrollbar.pack(side="right", fill="y")
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self.bind_all("<Button-4>", lambda e: self.wheel(e, -1))
+        self.bind_all("<Button-5>", lambda e: self.wheel(e, 1))
+
+    def set_items(self, items):
+        # rows are updated in place, the scroll position is kept
+        self.items = items
+        uids = {addon.uid for addon in items}
+        for uid in [uid for uid in self.changes if uid not in uids]:
+            del self.changes[uid]
+        self.render()
+
+    def visible(self):
+        if not self.row_height:
+            row = self.add_row()
+            row.update_idletasks()
+            self.row_height = row.winfo_reqheight() + 10
+        return max(1, self.canvas.winfo_height() // self.row_height)
+
+    def add_row(self):
+        row = AddonWidget(self.rows_frame)
+        row.grid(row=len(self.rows), column=0, sticky=tk.W, padx=10, pady=5)
+        # the wheel scrolls the list instead of the combobox values
+        for cbox in (row.opsys_cbox, row.sim_cbox):
+            cbox.bind("<Button-4>", lambda e: self.wheel(e, -1) or "break")
+            cbox.bind("<Button-5>", lambda e: self.wheel(e, 1) or "break")
+        self.rows.append(row)
+        return row
+
+    def render(self):
+        visible = self.visible()
+        while len(self.rows) < min(visible, len(self.items)):
+            self.add_row()
+        self.top = max(0, min(self.top, len(self.items) - visible))
+        for i, row in enumerate(self.rows):
+            if row.addon is not None and row.is_changed():
+                self.changes[row.addon.uid] = row.get_values()
+            if i < visible and self.top + i < len(self.items):
+                addon = self.items[self.top + i]
+                row.set_addon(addon, self.changes.pop(addon.uid, None))
+                row.grid()
+            else:
+                row.addon = None
+                row.grid_remove()
+        if self.items:
+            self.scrollbar.set(self.top / len(self.items), min(1.0, (self.top + visible) / len(self.items)))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def yview(self, *args):
+        visible = self.visible()
+        if args[0] == "moveto":
+            self.top = int(float(args[1]) * len(self.items))
+        elif args[0] == "scroll":
+            self.top += int(args[1]) * (visible if args[2] == "pages" else 1)
+        self.render()
+
+    def wheel(self, event, step):
+        if str(event.widget).startswith(str(self)):
+            self.yview("scroll", step, "units")
+
+
+class AddonView(ttk.Frame):
+    # addon list with sorting and filtering by sim, OS and out-of-date cycle
+    sort_keys = {
+        "ID": lambda addon: addon.uid,
+        "SOFTWARE": lambda addon: addon.name.lower(),
+        "OS": lambda addon: (addon.opsys, addon.uid),
+        "SIM": lambda addon: (addon.sim, addon.uid),
+        "AIRAC": lambda addon: (addon.cycle, addon.revision, addon.uid)
+    }
+
+    def __init__(self, container):
+        super().__init__(container)
+        self.addons = []
+        toolbar = ttk.Frame(self)
+        ttk.Label(toolbar, text="SORT:").grid(row=0, column=0, sticky=tk.NS)
+        self.sort_cbox = ttk.Combobox(toolbar, state="readonly", values=list(self.sort_keys), width=10)
+        self.sort_cbox.set("ID")
+        self.sort_cbox.grid(row=0, column=1, sticky=tk.NS, padx=0, pady=5)
+        ttk.Label(toolbar, text="OS:", style="Label.TLabel").grid(row=0, column=2, sticky=tk.NS)
+        self.opsys_cbox = ttk.Combobox(toolbar, state="readonly", values=["All"] + wx_opsys, width=8)
+        self.opsys_cbox.set("All")
+        self.opsys_cbox.grid(row=0, column=3, sticky=tk.NS, padx=0, pady=5)
+        ttk.Label(toolbar, text="SIM:", style="Label.TLabel").grid(row=0, column=4, sticky=tk.NS)
+        self.sim_cbox = ttk.Combobox(toolbar, state="readonly", values=["All"] + wx_sim, width=5)
+        self.sim_cbox.set("All")
+        self.sim_cbox.grid(row=0, column=5, sticky=tk.NS, padx=0, pady=5)
+        self.outdated = tk.BooleanVar(value=False)
+        ttk.Checkbutton(toolbar, text="OUT OF DATE", variable=self.outdated, command=self.apply).grid(row=0, column=6, sticky=tk.NS, padx=10, pady=5)
+        for cbox in (self.sort_cbox, self.opsys_cbox, self.sim_cbox):
+            cbox.bind("<<ComboboxSelected>>", self.cbox_changed)
+        toolbar.pack(anchor=tk.W, padx=10)
+        self.list = AddonList(self)
+        self.list.pack(fill=tk.BOTH, expand=tk.TRUE)
+
+    # event parameter from event object is mandatory
+    def cbox_changed(self, event):
+        event.widget.selection_clear()
+        self.apply()
+
+    def set_addons(self, addons):
+        self.addons = addons
+        self.apply()
+
+    def apply(self):
+        cycle = core.get_airac()
+        items = [addon for addon in self.addons
+                 if self.opsys_cbox.get() in ("All", addon.opsys)
+                 and self.sim_cbox.get() in ("All", addon.sim)
+                 and not (self.outdated.get() and addon.cycle == cycle)]
+        items.sort(key=self.sort_keys[self.sort_cbox.get()])
+        self.list.set_items(items)
+
+
 class ScrollableFrame(ttk.Frame):
     def __init__(self, container, *args, **kwargs):
         super().__init__(container, *args, **kwargs)
@@ -301,12 +471,9 @@ class ScrollableFrame(ttk.Frame):
 
 
 def addon_list():
-    # Iterate through every widget inside the frame and delete it
-    for widget in content_frame.scrollable_frame.winfo_children():
-        widget.destroy()
-    # Iterate through every addon and create custom widget
-    for addon in core.addons:
-        AddonWidget(content_frame.scrollable_frame, addon)
+    settings_frame.pack_forget()
+    addon_view.pack(fill=tk.BOTH, expand=tk.TRUE)
+    addon_view.set_addons(core.addons)
     # Set button state
     add_addon_btn.config(state=tk.NORMAL)
 
@@ -316,43 +483,222 @@ def add_addon():
     refresh()
 
 
-def update():
+def run_worker(target, done):
+    # run core work off the Tk main thread, the result comes back through the events queue
+    global busy
+    if busy:
+        return
+    busy = True
+    cancel_event.clear()
+    set_buttons(tk.DISABLED)
     pbar["value"] = 1
-    main.update()
-    items = len(core.addons)
-    if items > 0:
-        step = 100 / items
-        for addon in core.addons:
-            result = core.update(addon)
-            print(result)
-            pbar["value"] += step
-            main.update()
-            if result == 1:
-                messagebox.showwarning("Warning", f"Archive file for Addon ID: {addon.uid} is missing!")
-    messagebox.showinfo("Information", "Update is done!")
+
+    def run():
+        try:
+            result = target()
+        except Exception as err:
+            # done() gets the exception instead of a result
+            logging.exception("background job failed")
+            result = err
+        events.put(("done", done, result))
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def core_event(event, data):
+    # called from core worker threads, handed over to the Tk main thread
+    events.put((event, data))
+
+
+def poll_events():
+    # drain the queue and redraw once per poll, progress events in between are dropped
+    global busy, update_total
+    progress = None
+    status = None
+    try:
+        while True:
+            event = events.get_nowait()
+            if event[0] == "progress":
+                progress = event[1]
+            elif event[0] == "update":
+                update_bytes.clear()
+                update_total = event[1]["total_bytes"]
+            elif event[0] == "install":
+                data = event[1]
+                update_bytes[data["uid"]] = data["bytes"]
+                if update_total > 0:
+                    progress = 100 * sum(update_bytes.values()) / update_total
+                status = f"{data['name']}: {data['bytes'] / 1000000:.1f} / {data['total_bytes'] / 1000000:.1f} MB, {data['rate']:.1f} MB/s"
+            elif event[0] == "delete":
+                data = event[1]
+                status = f"{data['name']}: deleted {data['files']} / {data['total_files']} files"
+            elif event[0] == "watched":
+                # an archive was installed while watching, the worker keeps running
+                addon_list()
+                pbar["value"] = 1
+                status = f"Installed {event[1]}, watching for downloads ..."
+            elif event[0] == "done":
+                busy = False
+                set_buttons(tk.NORMAL)
+                set_status("Made with ♥ by github.com/berndgz")
+                pbar["value"] = 0
+                progress = None
+                status = None
+                event[1](event[2])
+    except queue.Empty:
+        pass
+    if progress is not None:
+        pbar["value"] = progress
+    if status is not None:
+        set_status(status)
+    main.after(100, poll_events)
+
+
+def set_status(text):
+    style.configure('text.Horizontal.TProgressbar', text=text)
+
+
+def set_buttons(state):
+    for btn in (download_btn, download_update_btn, update_btn, watch_btn, refresh_btn):
+        btn.config(state=state)
+    cancel_btn.config(state=tk.NORMAL if state == tk.DISABLED else tk.DISABLED)
+
+
+def cancel():
+    print("cancel requested")
+    cancel_event.set()
+    cancel_btn.config(state=tk.DISABLED)
+
+
+def show_error(result):
+    # a background job raised, see run_worker()
+    if isinstance(result, Exception):
+        messagebox.showerror("Error", f"{type(result).__name__}: {result}\n\nSee the log for details!")
+        return True
+    return False
+
+
+def download():
+    run_worker(lambda: core.download(cancel=cancel_event), download_done)
+
+
+def download_done(report):
+    print(report)
+    if show_error(report):
+        refresh()
+        return
+    for uid, result in (report or {}).items():
+        if result == 1:
+            messagebox.showwarning("Warning", f"Download for Addon ID: {uid} is not complete!")
+    refresh()
+
+
+def download_update():
+    # each archive is installed as soon as its download is complete, there is no plan to confirm
+    if not messagebox.askyesno("Download & Update", "Every archive is installed as soon as its download is complete, "
+                               "without showing the update plan first.\n\nStart the download?"):
+        return
+    run_worker(lambda: core.download_update(cancel=cancel_event), download_update_done)
+
+
+def download_update_done(report):
+    print(report)
+    if show_error(report):
+        refresh()
+        return
+    for uid, result in (report or {}).items():
+        if result == 1:
+            messagebox.showwarning("Warning", f"Download or update for Addon ID: {uid} failed!")
+    refresh()
+
+
+def update():
+    # the plan is shown first, the install tree is not touched before the update is confirmed
+    run_worker(lambda: core.plan_update(), plan_done)
+
+
+def plan_done(plans):
+    # nothing is installed without a plan
+    if show_error(plans):
+        return
+    plans = [item for item in plans or [] if item]
+    if plans:
+        lines = []
+        for item in plans:
+            line = (f"{item['name']}: {item['from_cycle']} -> {item['cycle']} rev {item['revision']}, delete {len(item['delete'])}, "
+                    f"add {len(item['add'])}, overwrite {len(item['overwrite'])} files, {item['net_bytes'] / 1000000:+.1f} MB")
+            if not item["valid"]:
+                line += ", refused, " + item["error"]
+            lines.append(line)
+        free = {item["device"]: item["free_bytes"] for item in plans}
+        lines.append(f"\nFree disk space: {sum(free.values()) / 1000000:.1f} MB")
+        if not core.check_plans(plans):
+            messagebox.showerror("Error", "\n".join(lines) + "\n\nThe update is refused, see the plan above!")
+            return
+        if not messagebox.askyesno("Update", "\n".join(lines) + "\n\nStart the update?"):
+            return
+    run_worker(lambda: core.update_all(cancel=cancel_event), update_done)
+
+
+def update_done(report):
+    print(report)
+    if show_error(report):
+        refresh()
+        return
+    for uid, result in (report or {}).items():
+        if result == 1:
+            messagebox.showwarning("Warning", f"Update for Addon ID: {uid} failed, see the log!")
+    if cancel_event.is_set():
+        messagebox.showinfo("Information", "Update is cancelled!")
+    else:
+        messagebox.showinfo("Information", "Update is done!")
+    refresh()
+
+
+def watch():
+    # update addons as soon as their archive is downloaded, until Cancel is pressed
+    if busy:
+        return
+    set_status("Watching for downloads ...")
+    run_worker(lambda: core.watch(cancel=cancel_event, callback=lambda name, report: events.put(("watched", name))), watch_done)
+
+
+def watch_done(result):
+    show_error(result)
     refresh()
 
 
 def settings():
+    addon_view.pack_forget()
     # Iterate through every widget inside the frame and delete it
-    for widget in content_frame.scrollable_frame.winfo_children():
+    for widget in settings_frame.scrollable_frame.winfo_children():
         widget.destroy()
     # Create settings widget
-    SettingsWidget(content_frame.scrollable_frame)
+    SettingsWidget(settings_frame.scrollable_frame)
+    settings_frame.pack(fill=tk.BOTH, expand=tk.TRUE)
     # Set button state
     add_addon_btn.config(state=tk.DISABLED)
 
 
+def init_progress():
+    loaded = []
+
+    def initialized(addon):
+        loaded.append(addon)
+        events.put(("progress", 100 * len(loaded) / len(core.addons)))
+
+    return initialized
+
+
 def refresh():
-    pbar["value"] = 1
-    main.update()
-    core.init()
-    for i in range(2, 101):
-        pbar["value"] = i
-        main.update()
-        # sleep(0.01)
-    pbar["value"] = 0
+    run_worker(lambda: core.init(callback=init_progress()), lambda result: addon_list())
+
+
+def startup_done(result):
     addon_list()
+    startup_step("addons loaded")
+    if startup_time:
+        tk_exit()
 
 
 def about():
@@ -385,23 +731,32 @@ addon_list_btn.grid(row=0, column=1, sticky=tk.NS, padx=0, pady=5)
 add_addon_btn = ttk.Button(header_frame, text="Add Addon", image=add_row_icon, compound=tk.LEFT, command=lambda: add_addon())
 add_addon_btn.grid(row=0, column=2, sticky=tk.NS, padx=10, pady=5)
 # ---- Download ----
-download_btn = ttk.Button(header_frame, text="Download", image=download_icon, compound=tk.LEFT, command=lambda: core.download())
+download_btn = ttk.Button(header_frame, text="Download", image=download_icon, compound=tk.LEFT, command=lambda: download())
 download_btn.grid(row=0, column=3, sticky=tk.NS, padx=0, pady=5)
+# ---- Download & Update ----
+download_update_btn = ttk.Button(header_frame, text="Download & Update", image=download_icon, compound=tk.LEFT, command=lambda: download_update())
+download_update_btn.grid(row=0, column=4, sticky=tk.NS, padx=10, pady=5)
 # ---- Update ----
 update_btn = ttk.Button(header_frame, text="Update", image=update_icon, compound=tk.LEFT, command=lambda: update())
-update_btn.grid(row=0, column=4, sticky=tk.NS, padx=10, pady=5)
+update_btn.grid(row=0, column=5, sticky=tk.NS, padx=0, pady=5)
+# ---- Watch ----
+watch_btn = ttk.Button(header_frame, text="Watch", image=refresh_icon, compound=tk.LEFT, command=lambda: watch())
+watch_btn.grid(row=0, column=6, sticky=tk.NS, padx=10, pady=5)
+# ---- Cancel ----
+cancel_btn = ttk.Button(header_frame, text="Cancel", image=delete_icon, compound=tk.LEFT, command=lambda: cancel(), state=tk.DISABLED)
+cancel_btn.grid(row=0, column=7, sticky=tk.NS, padx=0, pady=5)
 # ---- Settings ----
 settings_btn = ttk.Button(header_frame, text="Settings", image=settings_icon, compound=tk.LEFT, command=lambda: settings())
-settings_btn.grid(row=0, column=5, sticky=tk.NS, padx=0, pady=5)
+settings_btn.grid(row=0, column=8, sticky=tk.NS, padx=10, pady=5)
 # ---- Refresh ----
 refresh_btn = ttk.Button(header_frame, text="Refresh", image=refresh_icon, compound=tk.LEFT, command=lambda: refresh())
-refresh_btn.grid(row=0, column=6, sticky=tk.NS, padx=10, pady=5)
+refresh_btn.grid(row=0, column=9, sticky=tk.NS, padx=0, pady=5)
 # ---- About ----
 about_btn = ttk.Button(header_frame, text="About", image=about_icon, compound=tk.LEFT, command=lambda: about())
-about_btn.grid(row=0, column=7, sticky=tk.NS, padx=0, pady=5)
+about_btn.grid(row=0, column=10, sticky=tk.NS, padx=10, pady=5)
 # ---- Exit ----
 exit_btn = ttk.Button(header_frame, text="Exit", image=exit_icon, compound=tk.LEFT, command=lambda: tk_exit())
-exit_btn.grid(row=0, column=8, sticky=tk.NS, padx=10, pady=5)
+exit_btn.grid(row=0, column=11, sticky=tk.NS, padx=0, pady=5)
 # ---- [/] ----
 header_frame.pack(fill=tk.X)
 # ---- SEPARATOR ----
@@ -409,7 +764,9 @@ ttk.Separator(main, orient="horizontal").pack(fill=tk.X)
 # -----------------------
 # ---- Content Frame ----
 # -----------------------
-content_frame = ScrollableFrame(main)
+content_frame = ttk.Frame(main)
+addon_view = AddonView(content_frame)
+settings_frame = ScrollableFrame(content_frame)
 # ---- [/] ----
 content_frame.pack(fill=tk.BOTH, expand=tk.TRUE)
 # ---- SEPARATOR ----
@@ -434,5 +791,10 @@ footer_frame.pack(fill=tk.X)
 # ----------------------
 
 # main.after(1000, refresh())
-refresh()
+core.subscribe(core_event)
+main.after(100, poll_events)
+startup_step("window created")
+main.after_idle(lambda: startup_step("window shown"))
+# the window shows immediately, the database and addon data are loaded in the background
+run_worker(lambda: core.setup(callback=init_progress()), startup_done)
 main.mainloop()
@@ -10,10 +10,12 @@ rm -rv "$CURR_DIR/dist"
 rm -rv "$CURR_DIR/lnxngfmsdm_gui.spec"
 
 printf "\ncompile binary..."
-pyinstaller --onefile --add-data 'images:images' lnxngfmsdm_gui.py
+# one-dir build, a one-file build unpacks itself to a temp directory on every launch
+pyinstaller --onedir --add-data 'images:images' lnxngfmsdm_gui.py
 
 printf "\ncopy binary..."
-cp -v "$CURR_DIR/dist/lnxngfmsdm_gui" "$CURR_DIR/lnxngfmsdm.AppDir/usr/bin"
+mkdir -p "$CURR_DIR/lnxngfmsdm.AppDir/usr/bin"
+cp -rv "$CURR_DIR/dist/lnxngfmsdm_gui/." "$CURR_DIR/lnxngfmsdm.AppDir/usr/bin"
 
 printf "\npackage binary..."
 ARCH=x86_64 tools/appimagetool-x86_64.AppImage lnxngfmsdm.AppDir